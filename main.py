@@ -1,6 +1,6 @@
 import streamlit as st
 import pandas as pd
-import google.generativeai as genai
+import numpy as np
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.http import MediaIoBaseDownload
@@ -11,8 +11,15 @@ import time
 import unicodedata
 import re
 import json
-from typing import List, Dict, Tuple, Any
+import hashlib
+import glob
+import functools
+import string
+import warnings
+import threading
+from typing import List, Dict, Tuple, Any, Optional, Iterator
 from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
 
 # Dependência opcional para Excel
 try:
@@ -21,6 +28,28 @@ try:
 except Exception:
     _HAS_OPENPYXL = False
 
+# Leitor de XLSX mais rápido (Rust), usado quando instalado; senão openpyxl (que o pandas já abre em read_only)
+try:
+    import python_calamine  # noqa: F401
+    _XLSX_ENGINE = 'calamine'
+except Exception:
+    _XLSX_ENGINE = 'openpyxl' if _HAS_OPENPYXL else None
+
+# Dependência opcional para exportação CSV em C++ (já vem com o Streamlit)
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    _HAS_PYARROW = True
+except Exception:
+    _HAS_PYARROW = False
+
+# Dependência opcional para (de)serialização JSON em C
+try:
+    import orjson
+    _HAS_ORJSON = True
+except Exception:
+    _HAS_ORJSON = False
+
 # Tenta carregar as configurações do arquivo config.py
 try:
     import config
@@ -37,13 +66,17 @@ except ImportError:
     st.stop()
 
 # --- Configuração da Gemini API ---
-try:
+@st.cache_resource(show_spinner=False)
+def _genai():
+    """Importa e configura o SDK do Gemini só no primeiro uso (uma vez por processo).
+    Reruns que só mexem em filtros não pagam o import do cliente (gRPC/auth)."""
+    import google.generativeai as genai
     genai.configure(api_key=GEMINI_API_KEY)
-except Exception as e:
-    st.error(f"Erro ao configurar a Gemini API. Verifique sua API Key. Detalhes: {e}")
-    st.stop()
+    return genai
 
 # --- Funções de Acesso ao Google Drive/Sheets ---
+_GOOGLE_SCOPES = ['https://www.googleapis.com/auth/drive.readonly', 'https://www.googleapis.com/auth/spreadsheets.readonly']
+
 @st.cache_resource
 def get_google_apis_services():
     """Autentica com as APIs do Google usando a conta de serviço."""
@@ -52,10 +85,7 @@ def get_google_apis_services():
         creds_dict = config.get_google_service_account_credentials()
         
         # Cria credenciais a partir do dict
-        creds = service_account.Credentials.from_service_account_info(
-            creds_dict,
-            scopes=['https://www.googleapis.com/auth/drive.readonly', 'https://www.googleapis.com/auth/spreadsheets.readonly']
-        )
+        creds = service_account.Credentials.from_service_account_info(creds_dict, scopes=_GOOGLE_SCOPES)
         sheets_service = build('sheets', 'v4', credentials=creds)
         drive_service = build('drive', 'v3', credentials=creds)
         # Guarda o email da conta de serviço para diagnóstico
@@ -83,11 +113,17 @@ def _execute_request_with_retries(request, max_retries: int = 3, backoff: float
     raise last_exc
 
 
+# Tamanho do chunk de download do Drive (MB); chunks maiores = menos requisições HTTP por arquivo
+try:
+    _DRIVE_DOWNLOAD_CHUNK = max(1, int(os.getenv('DRIVE_DOWNLOAD_CHUNK_MB', '16'))) * 1024 * 1024
+except ValueError:
+    _DRIVE_DOWNLOAD_CHUNK = 16 * 1024 * 1024
+
 def _download_drive_file_bytes(drive_service, file_id: str, max_retries: int = 3) -> bytes:
     """Baixa arquivo do Drive em chunks com retries para reduzir falhas de conexão."""
     buf = io.BytesIO()
     request = drive_service.files().get_media(fileId=file_id)
-    downloader = MediaIoBaseDownload(buf, request, chunksize=1024 * 1024)
+    downloader = MediaIoBaseDownload(buf, request, chunksize=_DRIVE_DOWNLOAD_CHUNK)
     done = False
     retries = 0
     while not done:
@@ -99,52 +135,379 @@ def _download_drive_file_bytes(drive_service, file_id: str, max_retries: int = 3
                 raise e
             time.sleep(min(5.0, 1.5 ** retries))
             continue
-    buf.seek(0)
-    return buf.read()
+    return buf.getvalue()
+
+
+# Downloads do Drive em paralelo (LOAD_DRIVE_MAX_WORKERS): as threads baixam e leem os arquivos; o tratamento (e qualquer st.*) fica na thread principal
+try:
+    _DRIVE_FETCH_WORKERS = max(1, int(os.getenv('LOAD_DRIVE_MAX_WORKERS', '8')))
+except ValueError:
+    _DRIVE_FETCH_WORKERS = 8
+# Arquivos baixados à frente do parse, por worker (limita a memória com pastas grandes)
+_DRIVE_PREFETCH_PER_WORKER = 2
+_MIME_SHEETS = 'application/vnd.google-apps.spreadsheet'
+_MIME_CSV = 'text/csv'
+_MIME_XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+# Cache em disco (parquet) dos DataFrames já tratados, por arquivo do Drive e modifiedTime
+_FRAME_CACHE_DIR = os.getenv('DRIVE_CACHE_DIR', os.path.join('.cache', 'drive_frames'))
+_FRAME_CACHE_VERSION = 6  # incrementar quando o tratamento por arquivo mudar
+
+def _frame_cache_path(item: Dict) -> Optional[str]:
+    """Caminho do parquet de um item do Drive, ou None se o cache não se aplica (sem pyarrow ou sem modifiedTime)."""
+    mtime = item.get('modifiedTime')
+    if not _HAS_PYARROW or not mtime:
+        return None
+    tag = hashlib.sha1(f"{_FRAME_CACHE_VERSION}:{mtime}".encode('utf-8')).hexdigest()[:12]
+    return os.path.join(_FRAME_CACHE_DIR, f"{item['id']}-{tag}.parquet")
+
+def _read_cached_frame(item: Dict) -> Optional[pd.DataFrame]:
+    """Lê o DataFrame tratado do cache em disco; None se ausente ou ilegível."""
+    path = _frame_cache_path(item)
+    if path is None or not os.path.exists(path):
+        return None
+    try:
+        return pd.read_parquet(path)
+    except Exception:
+        return None
+
+def _write_cached_frame(item: Dict, df: pd.DataFrame, tabs_skipped: int, file_warnings: Optional[List[str]] = None) -> None:
+    """Grava o DataFrame tratado no cache (zstd) e remove versões anteriores do mesmo arquivo. Falhas são ignoradas.
+    Abas ignoradas e avisos do arquivo vão em attrs, para serem repetidos quando o frame vier do cache."""
+    path = _frame_cache_path(item)
+    if path is None:
+        return
+    try:
+        os.makedirs(_FRAME_CACHE_DIR, exist_ok=True)
+        for old in glob.glob(os.path.join(_FRAME_CACHE_DIR, f"{glob.escape(item['id'])}-*.parquet")):
+            if old != path:
+                os.remove(old)
+        df = df.copy(deep=False)
+        df.attrs['tabs_skipped'] = int(tabs_skipped)
+        df.attrs['warnings'] = list(file_warnings or [])
+        tmp_path = f"{path}.tmp"
+        df.to_parquet(tmp_path, compression='zstd', index=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(f"{path}.tmp")
+        except OSError:
+            pass
+
+# Abas agregadas ignoradas por padrão
+_AGGREGATED_TAB_PAT = re.compile(r"^(resumo|dashboard|consolidado|grafico|gr[aá]fico|summary|pivot|totais?)$", re.IGNORECASE)
+_fetch_local = threading.local()
+
+def _thread_google_services(creds_dict: Optional[Dict], shared_services: Tuple):
+    """Serviços do Google da thread atual. Os objetos do googleapiclient não são thread-safe,
+    então cada thread de download constrói os seus a partir das mesmas credenciais."""
+    if creds_dict is None:
+        return shared_services
+    services = getattr(_fetch_local, 'services', None)
+    if services is None:
+        creds = service_account.Credentials.from_service_account_info(creds_dict, scopes=_GOOGLE_SCOPES)
+        services = (build('sheets', 'v4', credentials=creds), build('drive', 'v3', credentials=creds))
+        _fetch_local.services = services
+    return services
+
+def _sniff_csv_format(data: bytes) -> Tuple[str, str, bool]:
+    """Detecta (delimitador, decimal, detectado?) contando ',' e ';' na primeira linha (cabeçalho), direto nos bytes.
+    Regra de negócio: ';' → decimal ','; ',' → decimal '.'. Sem nenhum dos dois, assume ',' e '.'."""
+    first_line = data[:65536].split(b'\n', 1)[0]
+    n_semi = first_line.count(b';')
+    n_comma = first_line.count(b',')
+    if n_semi == 0 and n_comma == 0:
+        return ',', '.', False
+    if n_semi > n_comma:
+        return ';', ',', True
+    return ',', '.', True
+
+# Colunas numéricas das KPIs (nomes canônicos)
+_KPI_NUMERIC_COLS = ('quantidade', 'preco_unitario', 'receita_total')
+
+def _read_csv_as_text(data: bytes, delimiter: str, decimal: str = '.') -> pd.DataFrame:
+    """Lê um CSV com as colunas como texto: datas e números são tratados depois pelos normalizadores
+    (_coerce_date_series/_clean_numeric_series/_coerce_numeric_text_columns), já com a convenção decimal do arquivo.
+    Usa o leitor multithread do pyarrow quando disponível; senão, o engine C.
+    No pyarrow, as colunas das KPIs (pelo nome padronizado) são lidas direto como float64 com o separador
+    decimal do arquivo; se algum valor não for um número simples (moeda, milhar...), relê tudo como texto."""
+    if _HAS_PYARROW:
+        try:
+            # Tipos fixados já na leitura (o engine 'pyarrow' do pandas inferiria e depois converteria)
+            header = next(csv.reader(io.StringIO(data[:65536].decode('utf-8-sig').splitlines()[0]), delimiter=delimiter))
+            # Projeção: colunas sem nome (delimitadores sobrando no fim da linha) nem chegam a ser convertidas
+            named = [name for name in header if name.strip()]
+            if named and len(set(named)) == len(named):
+                numeric = {
+                    name for name in named
+                    if _REVERSE_ALIAS.get(_normalize_colname(name), _normalize_colname(name)) in _KPI_NUMERIC_COLS
+                }
+                attempts = [numeric, set()] if numeric else [set()]
+                for as_float in attempts:
+                    try:
+                        table = pacsv.read_csv(
+                            io.BytesIO(data),
+                            parse_options=pacsv.ParseOptions(delimiter=delimiter),
+                            convert_options=pacsv.ConvertOptions(
+                                include_columns=named,
+                                column_types={name: (pa.float64() if name in as_float else pa.string()) for name in named},
+                                strings_can_be_null=True,
+                                decimal_point=decimal,
+                            ),
+                        )
+                        return table.to_pandas()
+                    except pa.ArrowInvalid:
+                        if not as_float:
+                            raise
+        except Exception:
+            pass
+    return pd.read_csv(io.BytesIO(data), delimiter=delimiter, dtype=str)
+
+def _apply_decimal_convention(s: pd.Series, decimal: str) -> pd.Series:
+    """Converte números em texto para o padrão com '.' decimal, conforme a convenção do arquivo
+    (',' decimal → remove '.' de milhar e troca ',' por '.'; '.' decimal → remove ',' de milhar)."""
+    if pd.api.types.is_numeric_dtype(s):
+        return s
+    txt = s.astype('string')
+    if decimal == ',':
+        return txt.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return txt.str.replace(',', '', regex=False)
+
+def _coerce_numeric_text_columns(df: pd.DataFrame, decimal: str, skip: Tuple[str, ...] = ('data',) + _KPI_NUMERIC_COLS) -> pd.DataFrame:
+    """Colunas de texto (fora de `skip`) cujos valores são todos números simples na convenção do arquivo viram
+    numéricas, como o read_csv(decimal=..., thousands=...) fazia (ex.: custo, frete, id); as demais seguem como texto."""
+    for col in df.columns:
+        if col in skip or not (df[col].dtype == object or pd.api.types.is_string_dtype(df[col])):
+            continue
+        txt = _apply_decimal_convention(df[col], decimal).str.strip()
+        present = txt.dropna()
+        if present.empty or not present.str.fullmatch(_NUMERIC_TOKEN_RE).all():
+            continue
+        df[col] = pd.to_numeric(txt.to_numpy(dtype=object, na_value=np.nan))
+    return df
+
+def _prepare_csv_frame(df: pd.DataFrame, decimal: str) -> pd.DataFrame:
+    """Padroniza os nomes de um CSV lido como texto e converte os números conforme a convenção decimal:
+    KPIs com a limpeza flexível (_clean_numeric_series); demais colunas só se forem inteiramente numéricas."""
+    df = _standardize_dataframe(df)
+    for col in _KPI_NUMERIC_COLS:
+        if col in df.columns:
+            df[col] = _clean_numeric_series(_apply_decimal_convention(df[col], decimal))
+    return _coerce_numeric_text_columns(df, decimal)
+
+def _concat_frames(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    """Concatena abas/arquivos com índice novo. Com um único frame não há cópia; com vários, as colunas
+    seguem a ordem de primeira aparição (sort=False) e frames vazios são descartados antes do concat."""
+    frames = [f for f in frames if f is not None and len(f.columns) > 0]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+    return pd.concat(frames, ignore_index=True, sort=False)
+
+def _is_text_series(s: pd.Series) -> bool:
+    """True se a série só tem textos (ou nulos). Colunas object com números misturados (ex.: SKUs numéricos
+    vindos do XLSX) não contam: categorizá-las geraria categorias mistas, que não casam com as opções em texto."""
+    if s.dtype == object:
+        return pd.api.types.infer_dtype(s, skipna=True) in ('string', 'empty')
+    return pd.api.types.is_string_dtype(s)
+
+def _align_categoricals(frames: List[pd.DataFrame], cols: Tuple[str, ...] = ('produto', 'regiao', 'source_file')) -> List[pd.DataFrame]:
+    """Converte colunas de texto de baixa cardinalidade para um CategoricalDtype comum a todos os frames.
+    Com as mesmas categorias, o concat só junta os códigos inteiros (sem promover para object nem copiar strings).
+    A coluna é ignorada se em algum frame ela não for texto (ex.: códigos numéricos)."""
+    for col in cols:
+        series = [f[col] for f in frames if col in f.columns]
+        if not series or not all(_is_text_series(s) for s in series):
+            continue
+        try:
+            cats = pd.unique(np.concatenate([pd.unique(s.dropna().to_numpy(dtype=object)) for s in series]))
+            try:
+                cats = sorted(cats)
+            except TypeError:
+                pass
+            dtype = pd.CategoricalDtype(categories=cats)
+            for f in frames:
+                if col in f.columns:
+                    f[col] = f[col].astype(dtype)
+        except Exception:
+            continue
+    return frames
+
+def _col_to_a1(n: int) -> str:
+    """Número da coluna (1-based) para a letra em notação A1 (1 → A, 27 → AA)."""
+    letters = ''
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def _sheet_a1_range(props: Dict) -> str:
+    """Intervalo A1 cobrindo a grade da aba; sem gridProperties, mantém o A1:ZZZ (evita truncar colunas)."""
+    title = "'" + str(props['title']).replace("'", "''") + "'"
+    grid = props.get('gridProperties') or {}
+    rows, cols = grid.get('rowCount'), grid.get('columnCount')
+    if rows and cols:
+        return f"{title}!A1:{_col_to_a1(int(cols))}{int(rows)}"
+    return f"{title}!A1:ZZZ"
+
+# Renderização dos valores lidos do Sheets
+_SHEETS_RENDER_OPTIONS = {'valueRenderOption': 'UNFORMATTED_VALUE', 'dateTimeRenderOption': 'FORMATTED_STRING'}
+
+def _stringify_mixed_columns(df: pd.DataFrame, keep: Tuple[str, ...] = _KPI_NUMERIC_COLS) -> pd.DataFrame:
+    """Colunas object com números e textos misturados (células nativas do Sheets) viram texto, exceto as de `keep`,
+    que seguem para _clean_numeric_series. Evita colunas de tipo misto no parquet do cache e no Arrow do st.dataframe."""
+    for col in df.columns:
+        if col in keep or df[col].dtype != object:
+            continue
+        # só tipos que contêm texto; 'mixed-integer-float' (só números, ex.: 1 e 2.5) segue numérica
+        if pd.api.types.infer_dtype(df[col], skipna=True) in ('mixed', 'mixed-integer'):
+            df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    return df
+
+def _fetch_drive_item(item: Dict, creds_dict: Optional[Dict], shared_services: Tuple) -> Dict[str, Any]:
+    """Baixa o conteúdo bruto de um arquivo do Drive (roda em thread de I/O).
+    Google Sheets → {'tabs': [(título, valores)], 'skipped': n}; CSV → {'frame', 'decimal', 'sniffed'};
+    XLSX → {'sheets': [(aba, df)], 'sheet_count': n} ou {'xlsx_error': exceção}.
+    O parse de CSV/XLSX também roda aqui (libera o GIL em boa parte); o tratamento fica na thread principal."""
+    sheets_service, drive_service = _thread_google_services(creds_dict, shared_services)
+    file_id = item['id']
+    mime_type = item['mimeType']
+    if mime_type == _MIME_SHEETS:
+        # Lê TODAS as abas (sheets) da planilha, limitando cada intervalo ao tamanho real da grade
+        meta_req = sheets_service.spreadsheets().get(
+            spreadsheetId=file_id, fields='sheets(properties(title,gridProperties(rowCount,columnCount)))'
+        )
+        meta = _execute_request_with_retries(meta_req, max_retries=3)
+        props = [s['properties'] for s in meta.get('sheets', [])]
+        kept = [p for p in props if not _AGGREGATED_TAB_PAT.match(str(p['title']).strip())]
+        ranges = [_sheet_a1_range(p) for p in kept]
+        tabs = []
+        if ranges:
+            try:
+                # Uma única requisição para todas as abas; números chegam nativos (sem máscara de moeda/milhar)
+                # e datas como o texto exibido na planilha
+                breq = sheets_service.spreadsheets().values().batchGet(spreadsheetId=file_id, ranges=ranges, **_SHEETS_RENDER_OPTIONS)
+                result = _execute_request_with_retries(breq, max_retries=3)
+                value_ranges = result.get('valueRanges', [])
+                tabs = [(p['title'], vr.get('values', [])) for p, vr in zip(kept, value_ranges)]
+            except Exception:
+                # Fallback: aba a aba, pulando as que falharem
+                for p, rng in zip(kept, ranges):
+                    try:
+                        vreq = sheets_service.spreadsheets().values().get(spreadsheetId=file_id, range=rng, **_SHEETS_RENDER_OPTIONS)
+                        result = _execute_request_with_retries(vreq, max_retries=3)
+                        tabs.append((p['title'], result.get('values', [])))
+                    except Exception:
+                        continue
+        return {'tabs': tabs, 'skipped': len(props) - len(kept)}
+    if mime_type == _MIME_CSV:
+        data = _download_drive_file_bytes(drive_service, file_id)
+        delimiter, decimal, sniffed = _sniff_csv_format(data)
+        return {'frame': _read_csv_as_text(data, delimiter, decimal), 'decimal': decimal, 'sniffed': sniffed}
+    if mime_type == _MIME_XLSX and _XLSX_ENGINE:
+        data = _download_drive_file_bytes(drive_service, file_id)
+        # Lê todas as abas (exceto as agregadas); erros de leitura voltam para a thread principal reportar
+        try:
+            xls = pd.ExcelFile(io.BytesIO(data), engine=_XLSX_ENGINE)
+            sheets = [
+                (sheet, pd.read_excel(xls, sheet_name=sheet))
+                for sheet in xls.sheet_names
+                if not _AGGREGATED_TAB_PAT.match(str(sheet).strip())
+            ]
+            return {'sheets': sheets, 'sheet_count': len(xls.sheet_names)}
+        except Exception as e:
+            return {'xlsx_error': e}
+    return {}
 
+# Caracteres especiais comuns substituídos por espaço em _normalize_colname (uma passada de str.translate)
+_COLNAME_TRANS = str.maketrans({c: ' ' for c in '/\\-.,;:()[]{}?!@#$%&*'})
+_UNDERSCORES_PAT = re.compile(r'_+')
+
+@functools.lru_cache(maxsize=4096)
 def _normalize_colname(name: str) -> str:
-    """Normaliza nome de coluna removendo acentos, convertendo para minúsculas e padronizando caracteres especiais."""
+    """Normaliza nome de coluna removendo acentos, convertendo para minúsculas e padronizando caracteres especiais.
+    Memoizada: os mesmos cabeçalhos se repetem entre arquivos e abas."""
     text = str(name).strip()
     # Remove acentos e normaliza unicode
     text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii')
     text = text.lower()
     # Remove caracteres especiais comuns, substituindo por espaço
-    for ch in ['/', '\\', '-', '.', ',', ';', ':', '(', ')', '[', ']', '{', '}', '  ', '?', '!', '@', '#', '$', '%', '&', '*']:
-        text = text.replace(ch, ' ')
+    text = text.translate(_COLNAME_TRANS)
     # Junta palavras com underscore e remove múltiplos underscores
     text = '_'.join(text.split())
-    text = re.sub(r'_+', '_', text)  # múltiplos _ para único
+    text = _UNDERSCORES_PAT.sub('_', text)  # múltiplos _ para único
     text = text.strip('_')  # remove _ do início/fim
     return text
 
+# Mapeia sinônimos para nomes canônicos
+_ALIAS_MAP = {
+    'data': {
+        'data', 'date', 'dt',
+        'data_venda', 'data_da_venda', 'data_pedido', 'data_do_pedido',
+        'data_emissao', 'emissao', 'emissao_nf', 'data_nf', 'data_nota',
+        'data_de_venda', 'data_de_emissao', 'dt_venda', 'dt_emissao'
+    },
+    'quantidade': {'quantidade', 'qtd', 'quant', 'qte'},
+    'preco_unitario': {'preco_unitario', 'preco', 'preco_unit', 'valor_unitario', 'preco_unitário', 'preco_venda'},
+    'receita_total': {'receita_total', 'receita', 'faturamento', 'valor_total', 'total'},
+    'produto': {'produto', 'item', 'sku', 'descricao', 'descricao_produto'},
+    'regiao': {'regiao', 'regiao_venda', 'regiao_geografica', 'regiao_', 'regioes', 'regional', 'regiao_cliente'},
+    'categoria': {'categoria', 'category', 'grupo', 'segmento', 'classe'}
+}
+# Índice invertido sinônimo → nome canônico (uma consulta de dict por coluna)
+_REVERSE_ALIAS = {alt: canon for canon, alts in _ALIAS_MAP.items() for alt in alts}
+
 def _standardize_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     if df is None or df.empty:
         return df
     # Renomeia colunas para formato normalizado
     df = df.rename(columns={c: _normalize_colname(c) for c in df.columns})
-    # Mapeia sinônimos para nomes canônicos
-    alias_map = {
-        'data': {
-            'data', 'date', 'dt',
-            'data_venda', 'data_da_venda', 'data_pedido', 'data_do_pedido',
-            'data_emissao', 'emissao', 'emissao_nf', 'data_nf', 'data_nota',
-            'data_de_venda', 'data_de_emissao', 'dt_venda', 'dt_emissao'
-        },
-        'quantidade': {'quantidade', 'qtd', 'quant', 'qte'},
-        'preco_unitario': {'preco_unitario', 'preco', 'preco_unit', 'valor_unitario', 'preco_unitário', 'preco_venda'},
-        'receita_total': {'receita_total', 'receita', 'faturamento', 'valor_total', 'total'},
-        'produto': {'produto', 'item', 'sku', 'descricao', 'descricao_produto'},
-        'regiao': {'regiao', 'regiao_venda', 'regiao_geografica', 'regiao_', 'regioes', 'regional', 'regiao_cliente'},
-        'categoria': {'categoria', 'category', 'grupo', 'segmento', 'classe'}
-    }
-    current = set(df.columns)
-    for canon, alts in alias_map.items():
-        found = [c for c in current if c in alts]
-        if found and canon not in df.columns:
-            df = df.rename(columns={found[0]: canon})
+    # Mapeia sinônimos para nomes canônicos (primeiro sinônimo encontrado vence; canônico já presente é mantido)
+    existing = set(df.columns)
+    to_rename: Dict[str, str] = {}
+    claimed = set()
+    for c in df.columns:
+        canon = _REVERSE_ALIAS.get(c)
+        if canon is None or canon in existing or canon in claimed:
+            continue
+        to_rename[c] = canon
+        claimed.add(canon)
+    if to_rename:
+        df = df.rename(columns=to_rename)
     return df
 
 
+# Formatos de data reconhecidos por amostragem (regex compilada → formato do strptime)
+_DATE_FORMAT_PATTERNS = [
+    (re.compile(r"\d{4}-\d{2}-\d{2}"), '%Y-%m-%d'),
+    (re.compile(r"\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}"), '%Y-%m-%d %H:%M:%S'),
+    (re.compile(r"\d{4}/\d{2}/\d{2}"), '%Y/%m/%d'),
+    (re.compile(r"\d{2}/\d{2}/\d{4}"), '%d/%m/%Y'),
+    (re.compile(r"\d{2}-\d{2}-\d{4}"), '%d-%m-%Y'),
+    (re.compile(r"\d{2}\.\d{2}\.\d{4}"), '%d.%m.%Y'),
+]
+
+
+def _detect_date_format(s: pd.Series, sample_size: int = 100, min_hits: float = 0.9) -> Optional[str]:
+    """Detecta o formato de data a partir de uma amostra dos valores não nulos.
+    Retorna o formato com >= min_hits de acertos na amostra, ou None se nenhum servir.
+    Para dd/mm/aaaa vs mm/dd/aaaa, assume o padrão brasileiro, exceto quando só o segundo campo passa de 12."""
+    sample = s.dropna().astype(str).str.strip().head(sample_size)
+    if sample.empty:
+        return None
+    for pattern, fmt in _DATE_FORMAT_PATTERNS:
+        hits = sample[sample.map(lambda x: pattern.fullmatch(x) is not None)]
+        if len(hits) < min_hits * len(sample):
+            continue
+        if fmt == '%d/%m/%Y':
+            first = hits.str[:2].astype(int)
+            second = hits.str[3:5].astype(int)
+            if (second > 12).any() and not (first > 12).any():
+                return '%m/%d/%Y'
+        return fmt
+    return None
+
+
 def _coerce_date_series(s: pd.Series) -> pd.Series:
     """Converte uma série para datetime de forma robusta:
     - Tenta múltiplos formatos comuns (ISO, BR, US)
@@ -154,11 +517,34 @@ def _coerce_date_series(s: pd.Series) -> pd.Series:
     """
     if s is None or len(s) == 0:
         return pd.to_datetime(pd.Series([], dtype='datetime64[ns]'))
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s
     
     try:
+        # Estratégia 0: formato detectado por amostragem → uma única conversão vetorizada
+        fmt = _detect_date_format(s)
+        if fmt is not None:
+            out = pd.to_datetime(s, format=fmt, errors='coerce')
+            non_null = s.notna().sum()
+            if non_null and out.notna().sum() >= 0.9 * non_null:
+                return out
+
         # Estratégia 1: Conversão automática com dayfirst=True (formato brasileiro)
-        out = pd.to_datetime(s, dayfirst=True, errors='coerce')
+        with warnings.catch_warnings():
+            warnings.filterwarnings('ignore', message='Could not infer format')
+            out = pd.to_datetime(s, dayfirst=True, errors='coerce')
         nat_ratio = out.isna().mean()
+        if nat_ratio < 0.1:  # >90% convertido: nem loop de formatos nem serial do Excel
+            return out
+        
+        # As estratégias abaixo varrem a série várias vezes. Como as datas se repetem muito
+        # (várias vendas no mesmo dia), converte só os valores distintos e mapeia de volta
+        if len(s) > 1000:
+            uniq = pd.unique(s.dropna())
+            if 2 * len(uniq) < len(s):
+                parsed = _coerce_date_series(pd.Series(uniq, dtype=object))
+                mapping = pd.Series(parsed.to_numpy(), index=uniq)
+                return pd.to_datetime(s.map(mapping), errors='coerce')
         
         # Estratégia 2: Se muitos NaT, tenta formatos específicos
         if nat_ratio > 0.5:
@@ -180,8 +566,8 @@ def _coerce_date_series(s: pd.Series) -> pd.Series:
                     if temp_nat_ratio < nat_ratio:
                         out = temp
                         nat_ratio = temp_nat_ratio
-                        if nat_ratio < 0.1:  # Se >90% sucesso, para aqui
-                            break
+                        if nat_ratio < 0.1:  # Se >90% sucesso, para aqui (serial do Excel não é necessário)
+                            return out
                 except Exception:
                     continue
         
@@ -210,13 +596,18 @@ def _ensure_date_column(df: pd.DataFrame) -> pd.DataFrame:
     if 'data' in df.columns:
         df['data'] = _coerce_date_series(df['data'])
         return df
-    # Tenta detectar coluna de data por taxa de parse
+    # Tenta detectar coluna de data por taxa de parse, avaliada numa amostra de até 200 valores não nulos
+    # (ponderada pela fração de não nulos da coluna); só a vencedora é convertida por inteiro
     best_col = None
     best_ratio = 0.0
     for c in df.columns:
         try:
-            parsed = _coerce_date_series(df[c])
-            ratio = parsed.notna().mean()
+            col = df[c]
+            sample = col.dropna().head(200)
+            if sample.empty:
+                continue
+            parsed = _coerce_date_series(sample)
+            ratio = parsed.notna().mean() * col.notna().mean()
             if ratio > best_ratio:
                 best_ratio = ratio
                 best_col = c
@@ -226,6 +617,9 @@ def _ensure_date_column(df: pd.DataFrame) -> pd.DataFrame:
         df['data'] = _coerce_date_series(df[best_col])
     return df
 
+_NUMERIC_NULL_TOKENS = ['', '-', '.', ',', 'N/A', 'n/a', '#N/A', 'NULL', 'null']
+_NUMERIC_TOKEN_RE = r"-?(?:\d+\.?\d*|\.\d+)"
+
 def _clean_numeric_series(s: pd.Series) -> pd.Series:
     """Normaliza números de forma elemento a elemento para evitar inflar valores.
     Regras:
@@ -234,81 +628,126 @@ def _clean_numeric_series(s: pd.Series) -> pd.Series:
     - Se a string tiver vírgula, trata como BR (',' decimal): remove pontos de milhar e troca vírgula por ponto.
     - Caso contrário, mantém '.' como decimal.
     - Trata valores vazios ou inválidos como NaN
+    As regras são aplicadas com o acessor .str (vetorizado), sem callback Python por célula.
     """
+    # Se já for numérico, retorna como está
+    if pd.api.types.is_numeric_dtype(s):
+        return s
+
+    sx = s.astype('string').str.strip()
+    sx = sx.mask(sx.isin(_NUMERIC_NULL_TOKENS))
+    # Remove moeda/símbolos, NBSP e espaços, mantendo apenas dígitos, sinais e separadores
+    sx = sx.str.replace(r"[^0-9,\.-]", "", regex=True)
+    sx = sx.mask(sx.isin(['', '-', '.', ',']))
+    # Se contém vírgula, tratamos como BR (vírgula = decimal): remove pontos de milhar e troca vírgula por ponto
+    has_comma = sx.str.contains(',', regex=False, na=False)
+    if has_comma.any():
+        br = sx.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+        sx = sx.mask(has_comma, br)
+    # Caso contrário, assume '.' como decimal (padrão internacional)
+    # Só sobram dígitos/sinais/separadores: o que não for um número válido vira NaN e o resto é convertido em bloco
+    sx = sx.where(sx.str.fullmatch(_NUMERIC_TOKEN_RE, na=False))
     try:
-        from pandas.api.types import is_numeric_dtype
+        values = sx.astype('Float64').to_numpy(dtype='float64', na_value=np.nan)
     except Exception:
-        is_numeric_dtype = lambda x: False  # fallback
+        values = pd.to_numeric(sx, errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+    return pd.Series(values, index=s.index, name=s.name)
 
-    # Se já for numérico, retorna como está
-    if is_numeric_dtype(s):
-        return s
-    
-    def _parse(x: object) -> float:
-        if x is None or pd.isna(x):
-            return float('nan')
-        
-        sx = str(x).strip()
-        
-        # Casos vazios
-        if sx == '' or sx in {'-', '.', ',', 'N/A', 'n/a', '#N/A', 'NULL', 'null'}:
-            return float('nan')
-        
-        # Remove moeda/símbolos, mantendo apenas dígitos, sinais e separadores
-        sx = re.sub(r"[^0-9,\.-]", "", sx)
-        sx = sx.replace('\u00A0', '').replace(' ', '').replace('\t', '')
-        
-        if sx == '' or sx in {'-', '.', ','}:
-            return float('nan')
-        
-        # Se contém vírgula, tratamos como BR (vírgula = decimal)
-        if ',' in sx:
-            # Remove pontos de milhar e troca vírgula por ponto
-            sx = sx.replace('.', '')
-            sx = sx.replace(',', '.')
-        # Caso contrário, assume '.' como decimal (padrão internacional)
-        
+def _to_arrow_numeric(df: pd.DataFrame, cols: Tuple[str, ...] = _KPI_NUMERIC_COLS) -> pd.DataFrame:
+    """Converte as colunas numéricas das KPIs para float64 com backend Arrow (se pyarrow estiver disponível).
+    Somas e produtos passam a rodar nos kernels em C++ do Arrow, e o st.dataframe serializa essas colunas sem conversão."""
+    if not _HAS_PYARROW:
+        return df
+    arrow_f64 = pd.ArrowDtype(pa.float64())
+    for col in cols:
+        if col in df.columns and pd.api.types.is_numeric_dtype(df[col]) and df[col].dtype != arrow_f64:
+            try:
+                df[col] = df[col].astype(arrow_f64)
+            except Exception:
+                pass
+    return df
+
+def _downcast_integer_columns(df: pd.DataFrame, cols: Tuple[str, ...] = ('quantidade',)) -> pd.DataFrame:
+    """Guarda colunas de contagem como int32 quando todos os valores são inteiros (metade da memória do float64).
+    Com pyarrow usa int32 Arrow (aceita nulos); sem pyarrow, só converte se não houver NaN.
+    Colunas monetárias ficam em float64: float32 perderia centavos nas somas."""
+    for col in cols:
+        if col not in df.columns or not pd.api.types.is_numeric_dtype(df[col]):
+            continue
         try:
-            return float(sx)
-        except (ValueError, TypeError):
-            return float('nan')
+            values = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+            valid = values[~np.isnan(values)]
+            if valid.size == 0 or not np.array_equal(valid, np.round(valid)):
+                continue
+            if valid.min() < np.iinfo(np.int32).min or valid.max() > np.iinfo(np.int32).max:
+                continue
+            if _HAS_PYARROW:
+                df[col] = df[col].astype(pd.ArrowDtype(pa.int32()))
+            elif valid.size == values.size:
+                df[col] = values.astype(np.int32)
+        except Exception:
+            continue
+    return df
+
+def _categorize_text_columns(df: pd.DataFrame, max_ratio: float = 0.5) -> pd.DataFrame:
+    """Dicionariza (category) as colunas de texto restantes com poucos valores distintos, como categoria e source_sheet.
+    Identificadores ficam como texto: têm cardinalidade alta e são comparados como string."""
+    if df is None or df.empty:
+        return df
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        if col in _ID_COLUMNS or not _is_text_series(df[col]):
+            continue
+        try:
+            if df[col].nunique(dropna=True) <= max_ratio * len(df):
+                df[col] = df[col].astype('category')
+        except Exception:
+            continue
+    return df
 
-    return s.map(_parse)
+def _as_numeric(s: pd.Series) -> pd.Series:
+    """Retorna a série como numérica; evita a cópia de pd.to_numeric quando ela já é numérica."""
+    if pd.api.types.is_numeric_dtype(s):
+        return s
+    return pd.to_numeric(s, errors='coerce')
+
+# Rótulos de linhas de totais agregados
+_TOTAL_ROW_PAT = re.compile(r"^\s*totais?$|^\s*total\b", re.IGNORECASE)
 
 def _drop_total_rows(df: pd.DataFrame) -> pd.DataFrame:
     """Remove linhas de totais agregados baseadas em texto 'total' nas colunas de texto."""
     if df is None or df.empty:
         return df
-    str_cols = [c for c in df.columns if df[c].dtype == 'object']
+    str_cols = df.select_dtypes(include=['object', 'string', 'category']).columns.tolist()
     if not str_cols:
         return df
-    pat = re.compile(r"^\s*totais?$|^\s*total\b", re.IGNORECASE)
-    mask = pd.Series(False, index=df.index)
-    for c in str_cols:
-        try:
-            mask = mask | df[c].astype(str).str.match(pat)
-        except Exception:
-            continue
+    # Todas as colunas de texto em um único array: uma só varredura de regex, depois OR por linha
+    try:
+        flat = pd.Series(np.concatenate([df[c].astype(str).to_numpy(dtype=object) for c in str_cols]), dtype=object)
+        hits = flat.str.match(_TOTAL_ROW_PAT).to_numpy(dtype=bool, na_value=False)
+        mask = hits.reshape(len(str_cols), len(df)).any(axis=0)
+    except Exception:
+        return df
     return df[~mask]
 
+# Colunas reconhecidas como identificadores de pedido/nota
+_ID_COLUMNS = ['id', 'pedido_id', 'order_id', 'nota_id', 'invoice_id', 'id_pedido', 'id_nota', 'id_venda']
+
 def _deduplicate_dataframe(df: pd.DataFrame) -> Tuple[pd.DataFrame, int]:
     """Remove duplicatas com base em chaves preferenciais; retorna (df, removidos)."""
     if df is None or df.empty:
         return df, 0
     before = len(df)
-    id_candidates = [
-        'id', 'pedido_id', 'order_id', 'nota_id', 'invoice_id', 'id_pedido', 'id_nota', 'id_venda'
-    ]
-    key_cols = [c for c in id_candidates if c in df.columns]
+    key_cols = [c for c in _ID_COLUMNS if c in df.columns]
     if not key_cols:
-        key_cols = [c for c in ['data', 'produto', 'quantidade', 'preco_unitario', 'receita_total'] if c in df.columns]
+        key_cols = [c for c in ['data', 'produto', 'regiao', *_KPI_NUMERIC_COLS] if c in df.columns]
     subset = key_cols if key_cols else df.columns.tolist()
     deduped = df.drop_duplicates(subset=subset, keep='first', ignore_index=True)
     removed = before - len(deduped)
     return deduped, removed
 
 def _prepare_analysis_payload(df: pd.DataFrame, max_rows: int = 1000) -> Tuple[str, str]:
-    """Retorna (resumo_textual, csv_amostra) para enviar ao LLM."""
+    """Retorna (resumo_textual, amostra) para enviar ao LLM.
+    A amostra é um JSON colunar ({coluna: [valores...]}), que repete menos bytes que CSV linha a linha."""
     parts = []
     # KPIs básicos
     total_linhas = len(df)
@@ -323,37 +762,37 @@ def _prepare_analysis_payload(df: pd.DataFrame, max_rows: int = 1000) -> Tuple[s
         except Exception:
             pass
 
-    # Receita
-    receita_col = None
+    # Receita (sem gravar coluna auxiliar no df recebido, que pode vir do cache)
+    receita_sum = None
     if 'receita_total' in df.columns:
-        receita_col = 'receita_total'
+        receita_sum = df['receita_total'].sum(skipna=True)
     elif {'quantidade', 'preco_unitario'}.issubset(df.columns):
-        df['receita_total_calc'] = df['quantidade'] * df['preco_unitario']
-        receita_col = 'receita_total_calc'
-    if receita_col:
-        receita_sum = df[receita_col].sum(skipna=True)
+        receita_sum = (df['quantidade'] * df['preco_unitario']).sum(skipna=True)
+    if receita_sum is not None:
         parts.append(f"Receita total (estimada): {receita_sum:.2f}")
 
     # Agregações por mês, produto e região (se existirem)
     try:
         if 'data' in df.columns:
-            by_month = (
-                df.dropna(subset=['data'])
-                  .assign(mes=lambda x: x['data'].dt.to_period('M').astype(str))
-            )
-            agg_cols = [c for c in ['quantidade', 'preco_unitario', 'receita_total'] if c in by_month.columns]
-            if 'receita_total' not in agg_cols and {'quantidade','preco_unitario'}.issubset(by_month.columns):
-                by_month['receita_total'] = by_month['quantidade'] * by_month['preco_unitario']
-                agg_cols = list(set(agg_cols + ['receita_total']))
+            # Um único recorte com data válida, receita_total derivada uma vez e mês calculado uma vez,
+            # reaproveitado pelas agregações por mês e por dia
+            work = df.dropna(subset=['data'])
+            if 'receita_total' not in work.columns and {'quantidade','preco_unitario'}.issubset(work.columns):
+                work = work.assign(receita_total=work['quantidade'] * work['preco_unitario'])
+            work = work.assign(mes=work['data'].dt.to_period('M').astype(str))
+            agg_cols = [c for c in _KPI_NUMERIC_COLS if c in work.columns]
             if agg_cols:
-                g = by_month.groupby('mes')[agg_cols].sum(numeric_only=True).reset_index().head(24)
+                g = work.groupby('mes')[agg_cols].sum(numeric_only=True).reset_index().head(24)
                 parts.append("Receita por mês (até 24 períodos):\n" + g.to_csv(index=False))
+                gq = (
+                    work.groupby(work['data'].dt.to_period('Q').astype(str).rename('trimestre'))[agg_cols]
+                    .sum(numeric_only=True).reset_index().head(12)
+                )
+                parts.append("Receita por trimestre (até 12 períodos):\n" + gq.to_csv(index=False))
             
             # NOVO: Agregação por DIA (essencial para queries tipo "qual dia teve maior receita")
             if agg_cols:
-                by_day = df.dropna(subset=['data']).copy()
-                if 'receita_total' not in by_day.columns and {'quantidade','preco_unitario'}.issubset(by_day.columns):
-                    by_day['receita_total'] = by_day['quantidade'] * by_day['preco_unitario']
+                by_day = work
                 
                 day_agg = (
                     by_day.groupby('data')
@@ -369,34 +808,39 @@ def _prepare_analysis_payload(df: pd.DataFrame, max_rows: int = 1000) -> Tuple[s
                 parts.append("Top 30 dias com maior receita:\n" + day_agg.to_csv(index=False))
                 
                 # NOVO: Produto mais vendido por dia (para os top 10 dias)
+                # Um único filtro + groupby(['data','produto']) para os 10 dias, em vez de uma varredura por dia
                 if 'produto' in by_day.columns:
-                    top_days = day_agg.head(10)['data'].str[:10].tolist()
-                    day_product = []
-                    for day_str in top_days:
-                        day_data = by_day[by_day['data'].dt.strftime('%Y-%m-%d') == day_str]
-                        if len(day_data) > 0:
-                            prod_rank = (
-                                day_data.groupby('produto')['quantidade']
-                                .sum()
-                                .sort_values(ascending=False)
-                                .head(3)  # Top 3 produtos do dia
-                                .reset_index()
-                            )
-                            prod_rank['data'] = day_str
-                            day_product.append(prod_rank)
-                    
-                    if day_product:
-                        df_day_prod = pd.concat(day_product, ignore_index=True)
+                    top_dates = pd.to_datetime(day_agg.head(10)['data']).drop_duplicates()
+                    day_rank = pd.Series(np.arange(len(top_dates)), index=top_dates)
+                    days = by_day['data'].dt.normalize()
+                    in_top = days.isin(top_dates)
+                    if in_top.any():
+                        df_day_prod = (
+                            by_day.loc[in_top, ['produto', 'quantidade']]
+                            .assign(data=days[in_top])
+                            .groupby(['data', 'produto'], observed=True)['quantidade']
+                            .sum()
+                            .reset_index()
+                        )
+                        df_day_prod['_rank'] = df_day_prod['data'].map(day_rank)
+                        df_day_prod = (
+                            df_day_prod.sort_values(['_rank', 'quantidade'], ascending=[True, False], kind='stable')
+                            .groupby('_rank', sort=False)
+                            .head(3)  # Top 3 produtos do dia
+                        )
+                        df_day_prod['data'] = df_day_prod['data'].dt.strftime('%Y-%m-%d')
                         # Reorganizar colunas: data, produto, quantidade
                         df_day_prod = df_day_prod[['data', 'produto', 'quantidade']]
                         parts.append("Top 3 produtos mais vendidos nos 10 dias de maior receita:\n" + df_day_prod.to_csv(index=False))
     except Exception:
         pass
 
+    # Produtos e regiões: quantidade e, quando houver, receita na mesma agregação
+    group_cols = [c for c in ('quantidade', 'receita_total') if c in df.columns]
     try:
         if 'produto' in df.columns:
             gprod = (
-                df.groupby('produto')[['quantidade']].sum(numeric_only=True).sort_values(by='quantidade', ascending=False).head(10)
+                df.groupby('produto', observed=True)[group_cols].sum(numeric_only=True).sort_values(by='quantidade', ascending=False).head(10)
             )
             parts.append("Top 10 produtos por quantidade:\n" + gprod.to_csv())
     except Exception:
@@ -405,21 +849,46 @@ def _prepare_analysis_payload(df: pd.DataFrame, max_rows: int = 1000) -> Tuple[s
     try:
         if 'regiao' in df.columns:
             greg = (
-                df.groupby('regiao')[['quantidade']].sum(numeric_only=True).sort_values(by='quantidade', ascending=False).head(10)
+                df.groupby('regiao', observed=True)[group_cols].sum(numeric_only=True).sort_values(by='quantidade', ascending=False).head(10)
             )
             parts.append("Top 10 regiões por quantidade:\n" + greg.to_csv())
     except Exception:
         pass
 
     resumo = "\n\n".join(parts)
-    # Amostra
-    sample_df = df.head(max_rows)
-    return resumo, sample_df.to_csv(index=False)
+    # Amostra determinística em passo fixo (O(max_rows), sem embaralhar o df): como os dados vêm ordenados
+    # por data, cobre o período inteiro em vez de só as primeiras datas
+    if len(df) > max_rows > 0:
+        sample_df = df.iloc[np.linspace(0, len(df) - 1, num=max_rows, dtype=np.int64)]
+    else:
+        sample_df = df.head(max_rows)
+    columns: Dict[str, List[Any]] = {}
+    for c in sample_df.columns:
+        col = sample_df[c]
+        if pd.api.types.is_datetime64_any_dtype(col):
+            # Datas sem hora saem como YYYY-MM-DD (como no to_csv); NaT vira null
+            only_dates = bool((col.dropna() == col.dropna().dt.normalize()).all())
+            col = col.dt.strftime('%Y-%m-%d' if only_dates else '%Y-%m-%d %H:%M:%S')
+            columns[str(c)] = col.where(col.notna(), None).tolist()
+        else:
+            # object antes do where: nulos viram None (null no JSON) também em Arrow/Categorical, em vez de pd.NA/nan
+            columns[str(c)] = col.astype(object).where(col.notna(), None).tolist()
+    return resumo, _json_dumps(columns, default=str)
 
 
-@st.cache_data(ttl=3600) # Cache de dados por 1 hora
+# Máximo de linhas na amostra enviada ao Gemini na análise alternativa
+_FALLBACK_SAMPLE_ROWS = 3000
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def _cached_analysis_payload(data_key: Tuple, _df: pd.DataFrame, max_rows: int = 1000) -> Tuple[str, str]:
+    """_prepare_analysis_payload com cache pela assinatura do recorte; o DataFrame não entra no hash."""
+    return _prepare_analysis_payload(_df, max_rows=max_rows)
+
+
+@st.cache_resource(ttl=3600) # Cache por 1 hora; devolve o mesmo objeto a cada rerun (sem pickle/cópia)
 def load_sales_data(_drive_folder_id):
     """Carrega e consolida dados de vendas de múltiplas planilhas do Google Drive.
+    O resultado é compartilhado entre reruns e sessões: trate-o como somente leitura (use assign/copy para derivar).
     Retorna: (df_consolidado, lista_arquivos, stats, drive_info)
     lista_arquivos: List[Dict[name,id,mimeType,linhas]]
     stats: {file_count, row_count, load_seconds}
@@ -446,9 +915,12 @@ def load_sales_data(_drive_folder_id):
             items: List[Dict] = []
             page_token = None
             while True:
+                # A própria listagem traz os metadados de cada arquivo (sem files().get por item);
+                # pageSize no máximo da API reduz as páginas (o padrão é 100)
                 req = drive_service.files().list(
                     q=query,
-                    fields="nextPageToken, files(id, name, mimeType)",
+                    fields="nextPageToken, files(id, name, mimeType, modifiedTime)",
+                    pageSize=1000,
                     pageToken=page_token,
                     includeItemsFromAllDrives=True,
                     supportsAllDrives=True
@@ -467,183 +939,188 @@ def load_sales_data(_drive_folder_id):
                 return pd.DataFrame(), [], {"file_count": 0, "row_count": 0, "load_seconds": elapsed}, drive_info
 
             progress_bar = st.progress(0, text="Iniciando o carregamento dos dados...")
-            
-            for i, item in enumerate(items):
-                file_name = item['name']
-                file_id = item['id']
-                mime_type = item['mimeType']
-
-                progress_bar.progress((i + 1) / len(items), text=f"Lendo arquivo: {file_name}")
 
-                try:
-                    df = None
-
-                    if mime_type == 'application/vnd.google-apps.spreadsheet':
-                        # Lê TODAS as abas (sheets) da planilha e concatena
-                        meta_req = sheets_service.spreadsheets().get(spreadsheetId=file_id, fields='sheets(properties(title))')
-                        meta = _execute_request_with_retries(meta_req, max_retries=3)
-                        sheet_titles = [s['properties']['title'] for s in meta.get('sheets', [])]
-                        # ignora abas agregadas por padrão
-                        skip_pat = re.compile(r"^(resumo|dashboard|consolidado|grafico|gr[aá]fico|summary|pivot|totais?)$", re.IGNORECASE)
-                        orig_count = len(sheet_titles)
-                        sheet_titles = [t for t in sheet_titles if not re.match(skip_pat, str(t).strip())]
-                        aggregated_tabs_skipped += max(0, orig_count - len(sheet_titles))
-                        sub_frames = []
-                        for title in sheet_titles:
-                            try:
-                                rng = f"{title}!A1:ZZZ"  # evita truncar colunas
-                                vreq = sheets_service.spreadsheets().values().get(spreadsheetId=file_id, range=rng)
-                                result = _execute_request_with_retries(vreq, max_retries=3)
-                                values = result.get('values', [])
-                                if not values or len(values) < 2:
-                                    continue
-                                headers = values[0]
-                                tmp = pd.DataFrame(values[1:], columns=headers)
-                                tmp = _standardize_dataframe(tmp)
-                                tmp['source_sheet'] = title
-                                sub_frames.append(tmp)
-                            except Exception:
-                                continue
-                        if sub_frames:
-                            df = pd.concat(sub_frames, ignore_index=True)
-                        else:
-                            st.info(f"Arquivo '{file_name}' sem dados utilizáveis. Pulado.")
-
-                    elif mime_type == 'text/csv':
-                        # --- INÍCIO DA LÓGICA FLEXÍVEL DE LEITURA ---
-                        csv_content_bytes = _download_drive_file_bytes(drive_service, file_id)
-
-                        detected_delimiter = ','  # Padrão
-                        detected_decimal = '.'    # Padrão
-
-                        try:
-                            # Tenta detectar o formato lendo uma amostra
-                            sample_text = csv_content_bytes[:2048].decode('utf-8', errors='ignore')
-                            dialect = csv.Sniffer().sniff(sample_text, delimiters=',;')
-                            detected_delimiter = dialect.delimiter
-
-                            # Regra de negócio: infere o decimal baseado no delimitador
-                            if detected_delimiter == ';':
-                                detected_decimal = ','
-                            elif detected_delimiter == ',':
-                                detected_decimal = '.'
-
-                        except (csv.Error, UnicodeDecodeError):
-                            # Se o 'sniff' falhar, apenas assume o padrão (vírgula/ponto)
-                            st.info(f"Não foi possível detectar o formato de '{file_name}'. Tentando com delimitador ',' e decimal '.'.")
-                            detected_delimiter = ','
-                            detected_decimal = '.'
-
-                        # Definir separador de milhar com base no decimal inferido
-                        thousands = '.' if detected_decimal == ',' else ','
-                        # Rebobina o stream e lê com o pandas usando os parâmetros detectados
-                        csv_content = io.BytesIO(csv_content_bytes)
-                        df = pd.read_csv(
-                            csv_content,
-                            delimiter=detected_delimiter,
-                            decimal=detected_decimal,
-                            thousands=thousands
-                        )
-                        # --- FIM DA LÓGICA FLEXÍVEL ---
-
-                        # Normaliza colunas para verificar presença de 'data'
-                        df = _standardize_dataframe(df)
-                        if 'data' not in df.columns:
-                            st.warning(f"O arquivo CSV '{file_name}' foi lido mas não possui coluna de data reconhecida. Será incluído mesmo assim.")
-
-                    elif mime_type == 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet':
-                        # XLSX (Excel) - somente se openpyxl estiver instalado
-                        if not _HAS_OPENPYXL:
-                            st.error("Arquivo XLSX detectado, mas o pacote 'openpyxl' não está instalado. Adicione 'openpyxl' ao requirements.txt e reinstale.")
-                            unsupported_files.append(file_name)
-                            df = None
-                        else:
-                            xlsx_bytes = _download_drive_file_bytes(drive_service, file_id)
-                            xlsbio = io.BytesIO(xlsx_bytes)
-                            # Lê todas as abas
-                            try:
-                                xls = pd.ExcelFile(xlsbio, engine='openpyxl')
-                                sub_frames = []
-                                skip_pat = re.compile(r"^(resumo|dashboard|consolidado|grafico|gr[aá]fico|summary|pivot|totais?)$", re.IGNORECASE)
-                                orig_count = len(xls.sheet_names)
-                                for sheet in xls.sheet_names:
-                                    if re.match(skip_pat, str(sheet).strip()):
+            # Credenciais para os serviços por thread; sem elas, um único worker reaproveita os serviços compartilhados
+            try:
+                creds_dict = config.get_google_service_account_credentials()
+                workers = max(1, min(_DRIVE_FETCH_WORKERS, len(items)))
+            except Exception:
+                creds_dict = None
+                workers = 1
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="drive-fetch")
+            # shutdown no finally: exceção ou st.stop() no meio do laço não deixam o pool e os downloads na fila vazando
+            try:
+                # Arquivos inalterados desde a última carga (mesmo modifiedTime) vêm do cache em disco, sem download
+                cached_frames = [_read_cached_frame(item) for item in items]
+                # Os demais downloads rodam em paralelo ao parse, numa janela de leitura antecipada: no máximo
+                # _DRIVE_PREFETCH_PER_WORKER arquivos por worker ficam em memória à frente do parse.
+                # O parse segue a ordem da listagem (resultado determinístico)
+                to_fetch = iter([j for j, cached in enumerate(cached_frames) if cached is None])
+                futures: List[Optional[Future]] = [None] * len(items)
+
+                def _schedule_next_fetch() -> None:
+                    j = next(to_fetch, None)
+                    if j is not None:
+                        futures[j] = pool.submit(_fetch_drive_item, items[j], creds_dict, (sheets_service, drive_service))
+
+                for _ in range(workers * _DRIVE_PREFETCH_PER_WORKER):
+                    _schedule_next_fetch()
+
+                for i, (item, cached) in enumerate(zip(items, cached_frames)):
+                    future = futures[i]
+                    if future is not None:
+                        # libera uma vaga na janela assim que este arquivo começa a ser consumido
+                        _schedule_next_fetch()
+                    file_name = item['name']
+                    file_id = item['id']
+                    mime_type = item['mimeType']
+
+                    progress_bar.progress((i + 1) / len(items), text=f"Lendo arquivo: {file_name}")
+
+                    try:
+                        df = None
+                        tabs_skipped_before = aggregated_tabs_skipped
+                        # Avisos de diagnóstico do arquivo: guardados com o frame no cache e repetidos ao reaproveitá-lo
+                        file_warnings: List[str] = []
+
+                        if cached is not None:
+                            df = cached
+                            aggregated_tabs_skipped += int(df.attrs.get('tabs_skipped', 0))
+                            file_warnings = [str(w) for w in df.attrs.get('warnings', [])]
+                            df.attrs = {}
+
+                        elif mime_type == _MIME_SHEETS:
+                            raw = future.result()
+                            # Concatena as abas já baixadas
+                            aggregated_tabs_skipped += raw.get('skipped', 0)
+                            sub_frames = []
+                            for title, values in raw.get('tabs', []):
+                                try:
+                                    if not values or len(values) < 2:
                                         continue
-                                    tmp = pd.read_excel(xls, sheet_name=sheet, engine='openpyxl')
-                                    tmp = _standardize_dataframe(tmp)
+                                    headers = [str(h) for h in values[0]]
+                                    tmp = pd.DataFrame(values[1:], columns=headers)
+                                    tmp = _stringify_mixed_columns(_standardize_dataframe(tmp))
+                                    tmp['source_sheet'] = title
+                                    sub_frames.append(tmp)
+                                except Exception:
+                                    continue
+                            if sub_frames:
+                                df = _concat_frames(sub_frames)
+                            else:
+                                st.info(f"Arquivo '{file_name}' sem dados utilizáveis. Pulado.")
+
+                        elif mime_type == _MIME_CSV:
+                            # --- INÍCIO DA LÓGICA FLEXÍVEL DE LEITURA ---
+                            # Delimitador/decimal detectados e leitura como texto já feitos na thread de download
+                            raw = future.result()
+                            detected_decimal = raw['decimal']
+                            if not raw['sniffed']:
+                                st.info(f"Não foi possível detectar o formato de '{file_name}'. Tentando com delimitador ',' e decimal '.'.")
+                            df = raw['frame']
+                            # --- FIM DA LÓGICA FLEXÍVEL ---
+
+                            # Normaliza colunas (para verificar presença de 'data') e converte os números
+                            df = _prepare_csv_frame(df, detected_decimal)
+                            if 'data' not in df.columns:
+                                file_warnings.append(f"O arquivo CSV '{file_name}' foi lido mas não possui coluna de data reconhecida. Será incluído mesmo assim.")
+
+                        elif mime_type == _MIME_XLSX:
+                            # XLSX (Excel) - somente se openpyxl estiver instalado
+                            if not _XLSX_ENGINE:
+                                st.error("Arquivo XLSX detectado, mas o pacote 'openpyxl' não está instalado. Adicione 'openpyxl' ao requirements.txt e reinstale.")
+                                unsupported_files.append(file_name)
+                                df = None
+                            else:
+                                raw = future.result()
+                                # Abas já lidas na thread de download
+                                try:
+                                    if 'xlsx_error' in raw:
+                                        raise raw['xlsx_error']
+                                    sub_frames = []
+                                    orig_count = raw['sheet_count']
+                                    for sheet, tmp in raw['sheets']:
+                                        tmp = _standardize_dataframe(tmp)
                                     
-                                    # === VALIDAÇÃO E CONVERSÃO EXPLÍCITA DE TIPOS ===
-                                    # Forçar conversão de data se coluna existe
-                                    if 'data' in tmp.columns:
-                                        tmp['data'] = pd.to_datetime(tmp['data'], errors='coerce', dayfirst=True)
-                                        # Tenta também formato serial do Excel se muitos NaT
-                                        if tmp['data'].isna().mean() > 0.5:
-                                            numeric_dates = pd.to_numeric(tmp['data'], errors='coerce')
-                                            # Serial do Excel: 25569 = 1970-01-01
-                                            plausible = numeric_dates.between(20000, 80000)
-                                            if plausible.any():
-                                                excel_dates = pd.to_datetime(numeric_dates.where(plausible), unit='D', origin='1899-12-30', errors='coerce')
-                                                tmp['data'] = tmp['data'].combine_first(excel_dates)
+                                        # === VALIDAÇÃO E CONVERSÃO EXPLÍCITA DE TIPOS ===
+                                        # Forçar conversão de data se coluna existe
+                                        if 'data' in tmp.columns:
+                                            tmp['data'] = pd.to_datetime(tmp['data'], errors='coerce', dayfirst=True)
+                                            # Tenta também formato serial do Excel se muitos NaT
+                                            if tmp['data'].isna().mean() > 0.5:
+                                                numeric_dates = pd.to_numeric(tmp['data'], errors='coerce')
+                                                # Serial do Excel: 25569 = 1970-01-01
+                                                plausible = numeric_dates.between(20000, 80000)
+                                                if plausible.any():
+                                                    excel_dates = pd.to_datetime(numeric_dates.where(plausible), unit='D', origin='1899-12-30', errors='coerce')
+                                                    tmp['data'] = tmp['data'].combine_first(excel_dates)
                                     
-                                    # Forçar conversão de colunas numéricas
-                                    for col in ['quantidade', 'preco_unitario', 'receita_total']:
-                                        if col in tmp.columns:
-                                            # Primeiro tenta conversão direta
-                                            tmp[col] = pd.to_numeric(tmp[col], errors='coerce')
-                                            # Se muitos NaN, tenta limpeza flexível
-                                            if tmp[col].isna().mean() > 0.3:
-                                                tmp[col] = _clean_numeric_series(tmp[col])
-                                            # Garante que não há NaN, substitui por 0
-                                            tmp[col] = tmp[col].fillna(0)
+                                        # Forçar conversão de colunas numéricas
+                                        for col in _KPI_NUMERIC_COLS:
+                                            if col in tmp.columns:
+                                                # Primeiro tenta conversão direta
+                                                tmp[col] = pd.to_numeric(tmp[col], errors='coerce')
+                                                # Se muitos NaN, tenta limpeza flexível
+                                                if tmp[col].isna().mean() > 0.3:
+                                                    tmp[col] = _clean_numeric_series(tmp[col])
+                                                # Garante que não há NaN, substitui por 0
+                                                tmp[col] = tmp[col].fillna(0)
                                     
-                                    tmp['source_sheet'] = sheet
-                                    sub_frames.append(tmp)
+                                        tmp['source_sheet'] = sheet
+                                        sub_frames.append(tmp)
                                     
-                                    # Log de diagnóstico (apenas em debug)
-                                    if os.getenv('DEBUG_MODE') == '1':
-                                        st.info(f"[DEBUG] Aba '{sheet}': {len(tmp)} linhas | Colunas: {list(tmp.columns)}")
-                                        if 'data' in tmp.columns:
-                                            st.info(f"[DEBUG] Datas válidas: {tmp['data'].notna().sum()}/{len(tmp)} | Range: {tmp['data'].min()} a {tmp['data'].max()}")
+                                        # Log de diagnóstico (apenas em debug)
+                                        if os.getenv('DEBUG_MODE') == '1':
+                                            st.info(f"[DEBUG] Aba '{sheet}': {len(tmp)} linhas | Colunas: {list(tmp.columns)}")
+                                            if 'data' in tmp.columns:
+                                                st.info(f"[DEBUG] Datas válidas: {tmp['data'].notna().sum()}/{len(tmp)} | Range: {tmp['data'].min()} a {tmp['data'].max()}")
                                 
-                                aggregated_tabs_skipped += max(0, orig_count - len(sub_frames))
-                                df = pd.concat(sub_frames, ignore_index=True) if sub_frames else None
+                                    aggregated_tabs_skipped += max(0, orig_count - len(sub_frames))
+                                    df = _concat_frames(sub_frames) if sub_frames else None
                                 
-                                # Validação pós-concatenação para XLSX
-                                if df is not None and not df.empty:
-                                    # Verificar se colunas essenciais têm dados válidos
-                                    warnings = []
-                                    if 'data' in df.columns and df['data'].isna().mean() > 0.5:
-                                        warnings.append(f"Mais de 50% das datas em '{file_name}' são inválidas")
-                                    if 'receita_total' in df.columns and (df['receita_total'] == 0).all():
-                                        warnings.append(f"Todas as receitas em '{file_name}' são zero - verifique formatação")
-                                    for w in warnings:
-                                        st.warning(f"⚠️ {w}")
+                                    # Validação pós-concatenação para XLSX
+                                    if df is not None and not df.empty:
+                                        # Verificar se colunas essenciais têm dados válidos
+                                        if 'data' in df.columns and df['data'].isna().mean() > 0.5:
+                                            file_warnings.append(f"⚠️ Mais de 50% das datas em '{file_name}' são inválidas")
+                                        if 'receita_total' in df.columns and (df['receita_total'] == 0).all():
+                                            file_warnings.append(f"⚠️ Todas as receitas em '{file_name}' são zero - verifique formatação")
                                 
-                            except Exception as e:
-                                st.error(f"Erro ao ler XLSX '{file_name}': {e}")
-                                if os.getenv('DEBUG_MODE') == '1':
-                                    import traceback
-                                    st.error(traceback.format_exc())
-                                df = None
-
-                    if df is not None:
-                        df = _standardize_dataframe(df)
-                        # Remover linhas de totais
-                        df = _drop_total_rows(df)
-                        # Garantir/Tratar coluna de data
-                        df = _ensure_date_column(df)
-                        for col in ['quantidade', 'preco_unitario', 'receita_total']:
-                            if col in df.columns:
-                                df[col] = _clean_numeric_series(df[col])
-                        # Marcar origem
-                        df['source_file'] = file_name
-                        all_data.append(df)
-                        loaded_files.append({"name": file_name, "id": file_id, "mimeType": mime_type, "rows": len(df)})
-
-                except Exception as file_error:
-                    st.error(f"Erro ao processar o arquivo {file_name}: {file_error}. Pulando...")
-
-            
+                                except Exception as e:
+                                    st.error(f"Erro ao ler XLSX '{file_name}': {e}")
+                                    if os.getenv('DEBUG_MODE') == '1':
+                                        import traceback
+                                        st.error(traceback.format_exc())
+                                    df = None
+
+                        if df is not None and cached is None:
+                            df = _standardize_dataframe(df)
+                            # Remover linhas de totais
+                            df = _drop_total_rows(df)
+                            # Garantir/Tratar coluna de data
+                            df = _ensure_date_column(df)
+                            for col in _KPI_NUMERIC_COLS:
+                                if col in df.columns:
+                                    df[col] = _clean_numeric_series(df[col])
+                            # Receita derivada no próprio arquivo (frame pequeno; vai junto para o cache)
+                            if 'receita_total' not in df.columns and {'quantidade', 'preco_unitario'}.issubset(df.columns):
+                                df['receita_total'] = df['quantidade'] * df['preco_unitario']
+                            _write_cached_frame(item, df, aggregated_tabs_skipped - tabs_skipped_before, file_warnings)
+
+                        for w in file_warnings:
+                            st.warning(w)
+
+                        if df is not None:
+                            # Marcar origem
+                            df['source_file'] = file_name
+                            all_data.append(df)
+                            loaded_files.append({"name": file_name, "id": file_id, "mimeType": mime_type, "rows": len(df)})
+
+                    except Exception as file_error:
+                        st.error(f"Erro ao processar o arquivo {file_name}: {file_error}. Pulando...")
+
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
             progress_bar.empty()
 
             if not all_data:
@@ -653,22 +1130,25 @@ def load_sales_data(_drive_folder_id):
                 drive_info = {"folder_id": _drive_folder_id, "counts_by_mime": dict(counts), "unsupported": unsupported_files}
                 return pd.DataFrame(), loaded_files, {"file_count": len(items), "row_count": 0, "load_seconds": elapsed}, drive_info
 
-            consolidated_df = pd.concat(all_data, ignore_index=True)
-            # Garante colunas em padrão canônico
-            consolidated_df = _standardize_dataframe(consolidated_df)
-            # Garantir/Tratar coluna de data consolidada
-            consolidated_df = _ensure_date_column(consolidated_df)
-            for col in ['quantidade', 'preco_unitario', 'receita_total']:
-                if col in consolidated_df.columns:
+            consolidated_df = _concat_frames(_align_categoricals(all_data))
+            # Cada arquivo já saiu padronizado, com 'data' convertida e números limpos; após o concat
+            # só é preciso retratar colunas que o concat tenha promovido para object (tipos mistos entre arquivos)
+            if 'data' in consolidated_df.columns and not pd.api.types.is_datetime64_any_dtype(consolidated_df['data']):
+                consolidated_df['data'] = _coerce_date_series(consolidated_df['data'])
+            for col in _KPI_NUMERIC_COLS:
+                if col in consolidated_df.columns and not pd.api.types.is_numeric_dtype(consolidated_df[col]):
                     consolidated_df[col] = _clean_numeric_series(consolidated_df[col])
-            # Calcula receita_total se ausente e possível
-            if 'receita_total' not in consolidated_df.columns and {'quantidade','preco_unitario'}.issubset(consolidated_df.columns):
-                consolidated_df['receita_total'] = consolidated_df['quantidade'] * consolidated_df['preco_unitario']
 
-            # Remover totais e deduplicar
-            consolidated_df = _drop_total_rows(consolidated_df)
+            # Deduplicar (as linhas de totais já saíram arquivo a arquivo, antes do cache; repetir aqui
+            # varreria de novo todo o texto consolidado, inclusive source_file)
             rows_before_dedup = len(consolidated_df)
             consolidated_df, dedup_removed = _deduplicate_dataframe(consolidated_df)
+            # Ordena por data (estável, NaT no fim): recortes por período viram busca binária (_sorted_date_bounds)
+            if 'data' in consolidated_df.columns:
+                consolidated_df = consolidated_df.sort_values('data', kind='stable', na_position='last', ignore_index=True)
+            consolidated_df = _to_arrow_numeric(consolidated_df)
+            consolidated_df = _downcast_integer_columns(consolidated_df)
+            consolidated_df = _categorize_text_columns(consolidated_df)
 
             elapsed = time.time() - start_ts
             stats = {
@@ -678,6 +1158,9 @@ def load_sales_data(_drive_folder_id):
                 "rows_before_dedup": rows_before_dedup,
                 "dedup_removed": dedup_removed,
                 "aggregated_tabs_skipped": aggregated_tabs_skipped,
+                # ordenação feita uma única vez aqui; o executor confia nela em vez de reverificar por consulta
+                "sorted_by_data": 'data' in consolidated_df.columns and pd.api.types.is_datetime64_dtype(consolidated_df['data']),
+                "loaded_at": time.time(),
             }
             counts = Counter([it.get('mimeType') for it in items])
             drive_info = {"folder_id": _drive_folder_id, "counts_by_mime": dict(counts), "unsupported": unsupported_files}
@@ -688,62 +1171,79 @@ def load_sales_data(_drive_folder_id):
             return pd.DataFrame(), [], {"file_count": 0, "row_count": 0, "load_seconds": 0.0}, {"folder_id": _drive_folder_id, "counts_by_mime": {}, "unsupported": []}
 
 
-def check_context_limit(sales_df, model_name: str) -> tuple[bool, str]:
-    """Verifica se o dataset excede os limites de contexto do modelo."""
-    # Definir limites aproximados por modelo (em número de linhas)
-    model_limits = {
-        'models/gemini-2.5-flash': 15000,
-        'models/gemini-2.5-pro': 50000,
-        'models/gemini-1.5-flash': 10000,
-        'models/gemini-1.5-pro': 30000,
-        'models/gemini-flash-latest': 15000,
-        'models/gemini-pro-latest': 50000,
-    }
-    
-    current_rows = len(sales_df)
-    limit = model_limits.get(model_name, 10000)  # default conservador
-    
-    if current_rows > limit:
-        suggested_models = []
-        for model, model_limit in model_limits.items():
-            if model_limit > current_rows:
-                suggested_models.append(model.replace('models/', ''))
-        
-        suggestion_text = f" Sugestão: use um modelo mais robusto como {', '.join(suggested_models[:2])}." if suggested_models else ""
-        
-        message = f"""
-⚠️ **Dataset muito grande para o modelo atual**
+@st.cache_resource(show_spinner=False)
+def _get_gemini_model(model_name: str):
+    """Instância de GenerativeModel reutilizada entre chamadas e sessões (uma por modelo)."""
+    return _genai().GenerativeModel(model_name)
 
-Seu dataset possui **{current_rows:,} linhas**, mas o modelo `{model_name.replace('models/', '')}` suporta aproximadamente **{limit:,} linhas**.
 
-{suggestion_text}
+@st.cache_data(show_spinner=False, ttl=3600)
+def _generate_text(model_name: str, prompt: Any) -> str:
+    """Chama o Gemini com cache por (modelo, prompt): a mesma pergunta sobre os mesmos dados
+    não refaz a chamada de rede. Exceções não são cacheadas e seguem para o chamador."""
+    response = _get_gemini_model(model_name).generate_content(prompt)
+    return response.text
 
-**Como resolver:**
-1. Vá na sidebar em "Configurações" 
-2. Altere o "Modelo do Gemini" para um mais robusto
-3. Ou aplique filtros para reduzir o dataset
-        """.strip()
-        
-        return False, message
-    
-    return True, ""
 
+@st.cache_resource(show_spinner=False)
+def _streamed_text_cache() -> Dict[str, str]:
+    """Respostas completas já transmitidas por _stream_text, indexadas por hash de (modelo, prompt)."""
+    return {}
 
-def get_gemini_analysis(user_query, sales_df, model_name: str = 'models/gemini-2.5-flash'):
-    """Envia a pergunta e os dados para o Gemini para análise."""
-    if sales_df.empty:
-        return "Os dados de vendas não foram carregados. Não consigo analisar."
 
-    # Verificar limite de contexto
-    is_within_limit, limit_message = check_context_limit(sales_df, model_name)
-    if not is_within_limit:
-        return limit_message
+_STREAMED_TEXT_CACHE_MAX = 256
+
 
-    csv_data = sales_df.to_csv(index=False)
+def _stream_text(model_name: str, prompt: Any, min_interval: float = 0.1) -> Iterator[str]:
+    """Versão em streaming de _generate_text, para uso com st.write_stream.
+    Agrupa os pedaços recebidos a cada ~min_interval segundos (evita re-parse do markdown a cada token)
+    e guarda a resposta completa em cache, de modo que a mesma pergunta sobre os mesmos dados não refaz a chamada."""
+    key = hashlib.sha256(f"{model_name}\x00{prompt!r}".encode('utf-8')).hexdigest()
+    cache = _streamed_text_cache()
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    response = _get_gemini_model(model_name).generate_content(prompt, stream=True)
+    parts: List[str] = []
+    pending: List[str] = []
+    last_flush = time.monotonic()
+    for chunk in response:
+        text = chunk.text
+        if not text:
+            continue
+        parts.append(text)
+        pending.append(text)
+        now = time.monotonic()
+        if now - last_flush >= min_interval:
+            yield "".join(pending)
+            pending.clear()
+            last_flush = now
+    if pending:
+        yield "".join(pending)
+    try:
+        if len(cache) >= _STREAMED_TEXT_CACHE_MAX:
+            cache.pop(next(iter(cache)), None)
+        cache[key] = "".join(parts)
+    except Exception:
+        pass
+
+
+def get_gemini_analysis(user_query, sales_df, model_name: str = 'models/gemini-2.5-flash', data_context: Optional[str] = None) -> Iterator[str]:
+    """Envia a pergunta e os dados para o Gemini para análise. Gera a resposta em streaming (para st.write_stream).
+    Os dados vão como resumo agregado + amostra (data_context), nunca como o CSV completo do recorte:
+    o prompt fica limitado independentemente do número de linhas."""
+    if sales_df.empty:
+        yield "Os dados de vendas não foram carregados. Não consigo analisar."
+        return
+
+    if data_context is None:
+        resumo, amostra = _prepare_analysis_payload(sales_df, max_rows=100)
+        data_context = f"RESUMO DOS DADOS\n{resumo}\n\nAMOSTRA (JSON por coluna - até 100 linhas)\n{amostra}"
     
     prompt_master = f"""
     # CONTEXTO & PERSONA
-    Você é o "AlphaBot", um analista de vendas sênior da empresa Alpha Insights. Sua função é analisar os dados de vendas anuais fornecidos em formato CSV e responder a perguntas de negócios com precisão e clareza, baseando-se EXCLUSIVAMENTE nos dados.
+    Você é o "AlphaBot", um analista de vendas sênior da empresa Alpha Insights. Sua função é analisar o resumo agregado e a amostra dos dados de vendas fornecidos e responder a perguntas de negócios com precisão e clareza, baseando-se EXCLUSIVAMENTE nesses dados. Caso precise de algo fora deles, diga que não está disponível.
 
     # REGRAS DE OPERAÇÃO
     1.  **Fidelidade aos Dados:** Responda APENAS com base nos dados. Se a pergunta não pode ser respondida (ex: "Qual a margem de lucro?"), responda: "Não tenho acesso a essa informação nos dados de vendas."
@@ -752,7 +1252,7 @@ def get_gemini_analysis(user_query, sales_df, model_name: str = 'models/gemini-2
     4.  **Não alucine:** Não invente dados ou tendências.
 
     # DADOS DE VENDAS
-    {csv_data}
+    {data_context}
 
     # PERGUNTA DO USUÁRIO
     {user_query}
@@ -761,11 +1261,35 @@ def get_gemini_analysis(user_query, sales_df, model_name: str = 'models/gemini-2
     """
     
     try:
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt_master)
-        return response.text
+        yield from _stream_text(model_name, prompt_master)
     except Exception as e:
-        return f"Desculpe, ocorreu um erro ao contatar o serviço de IA: {e}"
+        yield f"Desculpe, ocorreu um erro ao contatar o serviço de IA: {e}"
+
+
+# Padrões que indicam dependência sequencial (compilados uma vez em uma única alternância, sem diferenciar maiúsculas)
+_MULTISTEP_PATTERNS = [
+    # Conectores que ligam duas perguntas
+    r'\be\s+qual\b',
+    r'\be\s+o\s+que\b',
+    r'\be\s+quais\b',
+    r'\be\s+quanto\b',
+    r'\be\s+quando\b',
+    
+    # Referências a resultados anteriores
+    r'\bnesse\s+dia\b',
+    r'\bnessa\s+data\b',
+    r'\bnesse\s+m[eê]s\b',
+    r'\bnessa\s+regi[aã]o\b',
+    r'\bnesse\s+per[ií]odo\b',
+    r'\bnessa\s+semana\b',
+    
+    # Padrões de agregação + detalhe
+    r'maior.*\be\s+(qual|quais|o\s+que)',
+    r'menor.*\be\s+(qual|quais|o\s+que)',
+    r'mais.*\be\s+(qual|quais|o\s+que)',
+    r'menos.*\be\s+(qual|quais|o\s+que)',
+]
+_MULTISTEP_PAT = re.compile("|".join(f"(?:{p})" for p in _MULTISTEP_PATTERNS), re.IGNORECASE)
 
 
 def _detect_multistep_query(user_query: str) -> bool:
@@ -783,34 +1307,8 @@ def _detect_multistep_query(user_query: str) -> bool:
     """
     query_lower = user_query.lower()
     
-    # Padrões que indicam dependência sequencial
-    multistep_patterns = [
-        # Conectores que ligam duas perguntas
-        r'\be\s+qual\b',
-        r'\be\s+o\s+que\b',
-        r'\be\s+quais\b',
-        r'\be\s+quanto\b',
-        r'\be\s+quando\b',
-        
-        # Referências a resultados anteriores
-        r'\bnesse\s+dia\b',
-        r'\bnessa\s+data\b',
-        r'\bnesse\s+m[eê]s\b',
-        r'\bnessa\s+regi[aã]o\b',
-        r'\bnesse\s+per[ií]odo\b',
-        r'\bnessa\s+semana\b',
-        
-        # Padrões de agregação + detalhe
-        r'maior.*\be\s+(qual|quais|o\s+que)',
-        r'menor.*\be\s+(qual|quais|o\s+que)',
-        r'mais.*\be\s+(qual|quais|o\s+que)',
-        r'menos.*\be\s+(qual|quais|o\s+que)',
-    ]
-    
-    import re
-    for pattern in multistep_patterns:
-        if re.search(pattern, query_lower):
-            return True
+    if _MULTISTEP_PAT.search(query_lower):
+        return True
     
     # Detectar múltiplas perguntas (mais de um '?')
     if query_lower.count('?') > 1:
@@ -819,7 +1317,83 @@ def _detect_multistep_query(user_query: str) -> bool:
     return False
 
 
+# Perguntas diretas de KPI respondidas localmente (sem Planner/LLM).
+# Os padrões casam a pergunta inteira para não capturar recortes como "receita total em janeiro".
+_FAST_QUESTION_PREFIX = r"(?:qual\s+(?:(?:[eé]|foi)\s+)?)?(?:a\s+|o\s+)?"
+_FAST_PATTERNS = {
+    'receita': re.compile(_FAST_QUESTION_PREFIX + r"receita\s+(?:total|geral)\s*\??"),
+    'quantidade': re.compile(
+        _FAST_QUESTION_PREFIX
+        + r"(?:quantidade\s+total|qtd\s+total|total\s+de\s+(?:itens|produtos)\s+vendidos)(?:\s+vendid[ao]s?)?\s*\??"
+    ),
+    'pedidos': re.compile(r"quantos\s+pedidos(?:\s+(?:temos|h[aá]|existem|foram\s+feitos))?\s*\??"),
+    'ticket': re.compile(_FAST_QUESTION_PREFIX + r"ticket\s+m[eé]dio(?:\s+por\s+venda)?\s*\??"),
+    'transacoes': re.compile(
+        r"quant[ao]s\s+(?:linhas|vendas|transa[cç](?:[oõ]es|ao))(?:\s+(?:temos|h[aá]|existem|foram\s+feitas))?\s*\??"
+    ),
+}
+
+
+def _try_fast_answer(user_query: str, df: pd.DataFrame, kpis: Optional[Tuple[float, int, float]] = None) -> Optional[str]:
+    """Responde perguntas simples de KPI direto do DataFrame; retorna None para seguir o fluxo com LLM.
+    `kpis` = (receita_total, transações, ticket_médio) já calculados na página, quando disponíveis."""
+    if df is None or df.empty:
+        return None
+    query = ' '.join(user_query.lower().split())
+    try:
+        has_revenue = 'receita_total' in df.columns or _REV_COLS.issubset(df.columns)
+        if _FAST_PATTERNS['receita'].fullmatch(query):
+            if not has_revenue:
+                return None
+            if kpis is not None:
+                total = kpis[0]
+            elif 'receita_total' in df.columns:
+                total = float(_as_numeric(df['receita_total']).sum())
+            else:
+                total = _revenue_from_parts(df)
+            return f"A receita total nos dados selecionados é **{_fmt_brl(total)}** ({_fmt_int(len(df))} transações)."
+        if _FAST_PATTERNS['ticket'].fullmatch(query) and kpis is not None and has_revenue:
+            return f"O ticket médio (por venda) nos dados selecionados é **{_fmt_brl(kpis[2])}** ({_fmt_int(kpis[1])} transações)."
+        if _FAST_PATTERNS['transacoes'].fullmatch(query):
+            return f"Os dados selecionados têm **{_fmt_int(len(df))}** transações (linhas de venda)."
+        if _FAST_PATTERNS['quantidade'].fullmatch(query):
+            if 'quantidade' not in df.columns:
+                return None
+            total_q = _fmt_int(_as_numeric(df['quantidade']).sum())
+            return f"A quantidade total vendida nos dados selecionados é **{total_q}** itens."
+        if _FAST_PATTERNS['pedidos'].fullmatch(query):
+            id_cols = [c for c in _ID_COLUMNS if c in df.columns]
+            if id_cols:
+                n_orders = _fmt_int(df[id_cols[0]].nunique())
+                return f"Os dados selecionados têm **{n_orders}** pedidos distintos (coluna `{id_cols[0]}`)."
+            return f"Os dados selecionados têm **{_fmt_int(len(df))}** transações (não há coluna de identificador de pedido)."
+    except Exception:
+        return None
+    return None
+
+
 # ============== Planner → Executor para perguntas complexas ==============
+def _json_dumps(obj: Any, default: Optional[Any] = None) -> str:
+    """Serializa para JSON (unicode preservado) via orjson, com fallback para o módulo json.
+    `default` converte objetos não serializáveis, como no json.dumps."""
+    if _HAS_ORJSON:
+        try:
+            return orjson.dumps(obj, default=default).decode('utf-8')
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, default=default)
+
+
+def _json_loads(text: str) -> Any:
+    """Faz o parse de JSON via orjson, com fallback para o módulo json."""
+    if _HAS_ORJSON:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(text)
+
+
 def _build_data_catalog(df: pd.DataFrame) -> Dict[str, Any]:
     """Gera um catálogo simples de dados: colunas, tipos, métricas/dimensões candidatas e intervalos."""
     catalog: Dict[str, Any] = {
@@ -832,57 +1406,77 @@ def _build_data_catalog(df: pd.DataFrame) -> Dict[str, Any]:
     for c in df.columns:
         dtype = str(df[c].dtype)
         col_info = {"name": c, "dtype": dtype}
+        # colunas já tipadas no carregamento são lidas direto; a conversão só acontece (uma vez) se necessário
         if c == 'data':
             try:
-                col_info["min"] = str(pd.to_datetime(df[c], errors='coerce').min())
-                col_info["max"] = str(pd.to_datetime(df[c], errors='coerce').max())
+                dates = df[c] if pd.api.types.is_datetime64_any_dtype(df[c]) else pd.to_datetime(df[c], errors='coerce')
+                col_info["min"] = str(dates.min())
+                col_info["max"] = str(dates.max())
             except Exception:
                 pass
         elif pd.api.types.is_numeric_dtype(df[c]):
             try:
-                col_info["min"] = float(pd.to_numeric(df[c], errors='coerce').min())
-                col_info["max"] = float(pd.to_numeric(df[c], errors='coerce').max())
-                col_info["sum"] = float(pd.to_numeric(df[c], errors='coerce').sum())
+                values = df[c]
+                col_info["min"] = float(values.min())
+                col_info["max"] = float(values.max())
+                col_info["sum"] = float(values.sum())
             except Exception:
                 pass
         catalog["columns"].append(col_info)
         # Heurística de métricas e dimensões
-        if pd.api.types.is_numeric_dtype(df[c]) or c in {"quantidade", "preco_unitario", "receita_total"}:
+        if pd.api.types.is_numeric_dtype(df[c]) or c in _KPI_NUMERIC_COLS:
             catalog["metrics"].append(c)
         else:
             catalog["dimensions"].append(c)
     # Marcação de chaves/identificadores comuns
-    catalog["identifiers"] = [c for c in df.columns if c in [
-        'id','pedido_id','order_id','nota_id','invoice_id','id_pedido','id_nota','id_venda']]
+    catalog["identifiers"] = [c for c in df.columns if c in _ID_COLUMNS]
     return catalog
 
 
-def _plan_with_llm(user_query: str, catalog: Dict[str, Any], model_name: str) -> Dict[str, Any]:
-    """Solicita ao LLM um plano em JSON para executar sobre pandas. Retorna dicionário já parseado."""
+@st.cache_data(show_spinner=False, max_entries=8, ttl=3600)
+def _cached_data_catalog(data_key: Tuple, _df: pd.DataFrame) -> Dict[str, Any]:
+    """_build_data_catalog com cache pela assinatura do recorte; o DataFrame não entra no hash."""
+    return _build_data_catalog(_df)
+
+
+@st.cache_data(show_spinner=False, max_entries=8, ttl=3600)
+def _cached_catalog_json(data_key: Tuple, _catalog: Dict[str, Any]) -> str:
+    """JSON do catálogo para o prompt do planner, serializado uma vez por recorte."""
+    return _json_dumps(_catalog)
+
+
+# Formato de plano mostrado ao planner (constante; serializado uma única vez)
+_PLAN_SCHEMA_HINT_JSON = _json_dumps({
+    "filters": {"date_range": ["YYYY-MM-DD","YYYY-MM-DD"], "equals": {"coluna": ["valor1","valor2"]}},
+    "groupby": ["coluna1","coluna2"],
+    "metrics": [{"name": "receita_total", "agg": "sum"}],
+    "sort": {"by": "receita_total", "ascending": False},
+    "limit": 50,
+    "resposta_modelo": "O produto com maior receita foi {produto}, com {receita_total}."
+})
+
+
+def _plan_with_llm(user_query: str, catalog: Dict[str, Any], model_name: str, catalog_json: Optional[str] = None) -> Dict[str, Any]:
+    """Solicita ao LLM um plano em JSON para executar sobre pandas. Retorna dicionário já parseado.
+    `catalog_json` permite reaproveitar o catálogo já serializado (ver _cached_catalog_json)."""
     system = (
         "Você é um planejador de consultas tabulares. Produza SOMENTE um JSON válido que descreva um plano de análise sobre um DataFrame pandas. "
         "Não inclua comentários, markdown ou texto fora do JSON. Se não houver dados suficientes, retorne {\"error\": \"mensagem\"}."
     )
-    schema_hint = {
-        "filters": {"date_range": ["YYYY-MM-DD","YYYY-MM-DD"], "equals": {"coluna": ["valor1","valor2"]}},
-        "groupby": ["coluna1","coluna2"],
-        "metrics": [{"name": "receita_total", "agg": "sum"}],
-        "sort": {"by": "receita_total", "ascending": False},
-        "limit": 50
-    }
+    if catalog_json is None:
+        catalog_json = _json_dumps(catalog)
     prompt = f"""
     CATÁLOGO DE DADOS (JSON):
-    {json.dumps(catalog, ensure_ascii=False)}
+    {catalog_json}
 
     Esquematize um plano JSON para responder: {user_query}
     Use o seguinte formato de plano:
-    {json.dumps(schema_hint, ensure_ascii=False)}
+    {_PLAN_SCHEMA_HINT_JSON}
     Apenas colunas existentes no catálogo. Priorize métricas ['receita_total','quantidade','preco_unitario'] quando fizer sentido.
+    Em "resposta_modelo", escreva a resposta final em português usando marcadores {{coluna}} (colunas do groupby/métricas) no lugar dos valores; NUNCA escreva números do resultado. Ela será preenchida com a primeira linha do resultado.
     """
     try:
-        model = genai.GenerativeModel(model_name)
-        resp = model.generate_content([system, prompt])
-        text = resp.text or "{}"
+        text = _generate_text(model_name, [system, prompt]) or "{}"
         # Tente extrair JSON puro
         text_stripped = text.strip()
         if text_stripped.startswith("```) ") and text_stripped.endswith("```"):
@@ -893,7 +1487,7 @@ def _plan_with_llm(user_query: str, catalog: Dict[str, Any], model_name: str) ->
         last = text_stripped.rfind('}')
         if first >= 0 and last >= 0:
             text_stripped = text_stripped[first:last+1]
-        plan = json.loads(text_stripped)
+        plan = _json_loads(text_stripped)
         if not isinstance(plan, dict):
             return {"error": "Plano não é um objeto JSON."}
         return plan
@@ -901,35 +1495,101 @@ def _plan_with_llm(user_query: str, catalog: Dict[str, Any], model_name: str) ->
         return {"error": f"Falha ao planejar com LLM: {e}"}
 
 
-def _execute_plan(df: pd.DataFrame, plan: Dict[str, Any]) -> Dict[str, Any]:
-    """Executa um plano simples sobre um DataFrame usando pandas. Retorna dict com 'table' e 'summary'."""
+def _sorted_date_bounds(s: pd.Series, ini: pd.Timestamp, fim: pd.Timestamp) -> Optional[Tuple[int, int]]:
+    """Posições [início, fim) das datas entre ini e fim (inclusive) via busca binária. Pressupõe a coluna
+    ordenada com NaT no fim, como sai de load_sales_data (load_stats['sorted_by_data']): nada aqui é O(n)."""
+    if not pd.api.types.is_datetime64_dtype(s):
+        return None
+    arr = s.to_numpy()
+    # NaT ordena depois de qualquer data no numpy, então a primeira posição de NaT também sai por busca binária
+    n_valid = int(np.searchsorted(arr, np.datetime64('NaT').astype(arr.dtype), side='left'))
+    head = arr[:n_valid]
+    lo = int(np.searchsorted(head, np.datetime64(ini).astype(arr.dtype), side='left'))
+    hi = int(np.searchsorted(head, np.datetime64(fim).astype(arr.dtype), side='right'))
+    return lo, max(lo, hi)
+
+
+def _contains_ci_mask(s: pd.Series, needle: str) -> np.ndarray:
+    """Máscara bool de "contém `needle`" sem diferenciar maiúsculas (busca literal).
+    Em colunas Categorical, minúsculas e busca rodam só nas categorias e o resultado é mapeado pelos códigos."""
+    needle = needle.lower()
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        hits = np.asarray(s.cat.categories.astype(str).str.lower().str.contains(needle, regex=False), dtype=bool)
+        codes = s.cat.codes.to_numpy()
+        return np.where(codes >= 0, hits[codes], False) if len(hits) else np.zeros(len(s), dtype=bool)
+    return s.astype('string').str.lower().str.contains(needle, regex=False, na=False).to_numpy(dtype=bool, na_value=False)
+
+
+def _equals_mask(s: pd.Series, vals: Any) -> pd.Series:
+    """Máscara do filtro 'equals' respeitando o dtype nativo da coluna.
+    - Numéricas/datas: converte os valores do plano para o tipo da coluna e usa isin direto
+    - Categorical: casa (sem diferenciar maiúsculas) apenas contra as categorias
+    - Texto ou conversão impossível: comparação case-insensitive via str.lower()
+    """
+    if not isinstance(vals, (list, tuple, set)):
+        vals = [vals]
+    vals = list(vals)
+    try:
+        if pd.api.types.is_bool_dtype(s):
+            pass
+        elif pd.api.types.is_numeric_dtype(s):
+            typed = pd.to_numeric(pd.Series(vals, dtype=object), errors='coerce')
+            if typed.notna().all():
+                return s.isin(typed.to_numpy())
+        elif pd.api.types.is_datetime64_any_dtype(s):
+            typed = pd.to_datetime(pd.Series(vals, dtype=object), errors='coerce')
+            if typed.notna().all():
+                return s.isin(typed)
+        elif isinstance(s.dtype, pd.CategoricalDtype):
+            wanted = {str(v).lower() for v in vals}
+            return s.isin([c for c in s.cat.categories if str(c).lower() in wanted])
+    except Exception:
+        pass
+    # Normaliza valores para lowercase para comparação case-insensitive
+    vals_lower = [str(v).lower() for v in vals]
+    return s.astype(str).str.lower().isin(vals_lower)
+
+
+def _execute_plan(df: pd.DataFrame, plan: Dict[str, Any], sorted_by_date: bool = False) -> Dict[str, Any]:
+    """Executa um plano simples sobre um DataFrame usando pandas. Retorna dict com 'table' e 'summary'.
+    sorted_by_date indica que 'data' já está ordenada com NaT no fim (registrado na carga), o que permite
+    recortar o período por busca binária em vez de máscara."""
     result: Dict[str, Any] = {"table": pd.DataFrame(), "summary": ""}
     if df is None or df.empty:
         result["summary"] = "Sem dados para executar o plano."
         return result
-    work = df.copy()
-    # filtros por intervalo de data
+    # filtros do plano: todas as máscaras são combinadas e o recorte é materializado uma única vez
+    masks: List[np.ndarray] = []
+    bounds: Optional[Tuple[int, int]] = None
     try:
         filters = plan.get("filters", {}) if isinstance(plan, dict) else {}
-        if 'date_range' in filters and 'data' in work.columns:
+        if 'date_range' in filters and 'data' in df.columns:
             ini, fim = filters['date_range']
             ini_dt = pd.to_datetime(ini, errors='coerce')
             fim_dt = pd.to_datetime(fim, errors='coerce')
             if pd.notna(ini_dt) and pd.notna(fim_dt):
-                work = work[(work['data'] >= ini_dt) & (work['data'] <= fim_dt)]
+                # coluna ordenada: fatia contígua por busca binária; senão, máscara
+                if sorted_by_date:
+                    bounds = _sorted_date_bounds(df['data'], ini_dt, fim_dt)
+                if bounds is None:
+                    masks.append(((df['data'] >= ini_dt) & (df['data'] <= fim_dt)).to_numpy(dtype=bool, na_value=False))
         # equals - comparação case-insensitive para colunas de texto
         equals = filters.get('equals', {}) if isinstance(filters, dict) else {}
         for col, vals in equals.items():
-            if col in work.columns:
-                # Normaliza valores para lowercase para comparação case-insensitive
-                work_col_lower = work[col].astype(str).str.lower()
-                vals_lower = [str(v).lower() for v in vals]
-                work = work[work_col_lower.isin(vals_lower)]
+            if col in df.columns:
+                masks.append(_equals_mask(df[col], vals).to_numpy(dtype=bool, na_value=False))
     except Exception:
         pass
-    # derivar receita_total se preciso
+    work = df
+    if bounds is not None:
+        lo, hi = bounds
+        work = df.iloc[lo:hi]
+        masks = [m[lo:hi] for m in masks]
+    if masks:
+        work = work[np.logical_and.reduce(masks)]
+    # derivar receita_total se preciso (assign devolve um novo frame; o df recebido não é alterado)
     if 'receita_total' not in work.columns and {'quantidade','preco_unitario'}.issubset(work.columns):
-        work['receita_total'] = work['quantidade'] * work['preco_unitario']
+        work = work.assign(receita_total=work['quantidade'] * work['preco_unitario'])
     # groupby + metrics
     groupby = plan.get('groupby', []) if isinstance(plan, dict) else []
     metrics = plan.get('metrics', []) if isinstance(plan, dict) else []
@@ -942,7 +1602,7 @@ def _execute_plan(df: pd.DataFrame, plan: Dict[str, Any]) -> Dict[str, Any]:
     table = pd.DataFrame()
     try:
         if groupby and agg_spec:
-            table = work.groupby(groupby).agg(agg_spec).reset_index()
+            table = work.groupby(groupby, observed=True).agg(agg_spec).reset_index()
         elif agg_spec:
             table = work.agg(agg_spec).to_frame().T
         else:
@@ -962,9 +1622,9 @@ def _execute_plan(df: pd.DataFrame, plan: Dict[str, Any]) -> Dict[str, Any]:
     try:
         lines = [f"Linhas retornadas: {len(table)}"]
         if 'receita_total' in work.columns:
-            lines.append(f"Receita total no filtro: {_fmt_brl(float(work['receita_total'].sum()))}")
+            lines.append(f"Receita total no filtro: {_fmt_brl(float(_as_numeric(work['receita_total']).sum()))}")
         if 'quantidade' in work.columns:
-            lines.append(f"Quantidade total no filtro: {int(pd.to_numeric(work['quantidade'], errors='coerce').sum())}")
+            lines.append(f"Quantidade total no filtro: {int(_as_numeric(work['quantidade']).sum())}")
         result['summary'] = " | ".join(lines)
     except Exception:
         result['summary'] = f"Linhas retornadas: {len(table)}"
@@ -972,13 +1632,64 @@ def _execute_plan(df: pd.DataFrame, plan: Dict[str, Any]) -> Dict[str, Any]:
     return result
 
 
-def _narrate_results_with_llm(user_query: str, plan: Dict[str, Any], exec_res: Dict[str, Any], model_name: str) -> str:
-    """Gera uma resposta em linguagem natural usando o LLM baseada no resultado do Planner→Executor."""
+@st.cache_data(show_spinner=False, ttl=3600)
+def _cached_execute_plan(plan: Dict[str, Any], data_key: Tuple, _df: pd.DataFrame, sorted_by_date: bool = False) -> Dict[str, Any]:
+    """_execute_plan com cache por (plano, assinatura dos dados); o DataFrame não entra no hash."""
+    return _execute_plan(_df, plan, sorted_by_date=sorted_by_date)
+
+
+def _format_answer_value(col: str, value: Any) -> str:
+    """Formata um valor do resultado para a resposta: moeda em R$, inteiros com milhar, datas dd/mm/aaaa."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return "N/D"
+    if isinstance(value, (pd.Timestamp, np.datetime64)):
+        return pd.Timestamp(value).strftime('%d/%m/%Y')
+    if isinstance(value, (int, float, np.number)) and not isinstance(value, bool):
+        if any(k in col for k in ('receita', 'preco', 'valor', 'faturamento', 'ticket')):
+            return _fmt_brl(float(value))
+        if float(value).is_integer():
+            return _fmt_int(value)
+        return f"{float(value):,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.')
+    return str(value)
+
+
+def _fill_answer_template(template: Any, table: pd.DataFrame) -> Optional[str]:
+    """Preenche o 'resposta_modelo' do plano com a única linha do resultado.
+    Retorna None (e a narrativa segue pelo LLM) se o resultado não tiver exatamente uma linha
+    ou se algum marcador não corresponder a uma coluna."""
+    if not isinstance(template, str) or not template.strip():
+        return None
+    if not isinstance(table, pd.DataFrame) or len(table) != 1:
+        return None
+    try:
+        fields = [f for _, f, _, _ in string.Formatter().parse(template) if f is not None]
+        if not fields or any(f not in table.columns for f in fields):
+            return None
+        row = table.iloc[0]
+        return template.format(**{f: _format_answer_value(f, row[f]) for f in fields})
+    except Exception:
+        return None
+
+
+def _answer_from_plan(user_query: str, plan: Dict[str, Any], exec_res: Dict[str, Any], model_name: str) -> Iterator[str]:
+    """Resposta final do fluxo Planner→Executor.
+    Quando o resultado cabe em uma linha, preenche o 'resposta_modelo' do próprio plano (uma só chamada ao LLM
+    na pergunta inteira); caso contrário, gera a narrativa com uma segunda chamada."""
+    filled = _fill_answer_template(plan.get('resposta_modelo'), exec_res.get('table'))
+    if filled is not None:
+        yield filled
+        return
+    yield from _narrate_results_with_llm(user_query, plan, exec_res, model_name)
+
+
+def _narrate_results_with_llm(user_query: str, plan: Dict[str, Any], exec_res: Dict[str, Any], model_name: str) -> Iterator[str]:
+    """Gera uma resposta em linguagem natural usando o LLM baseada no resultado do Planner→Executor.
+    A resposta é produzida em streaming (para st.write_stream)."""
+    summary: str = exec_res.get('summary', '')
     try:
         table: pd.DataFrame = exec_res.get('table', pd.DataFrame())
-        summary: str = exec_res.get('summary', '')
         sample_csv = table.head(100).to_csv(index=False) if isinstance(table, pd.DataFrame) and not table.empty else ''
-        plan_json = json.dumps(plan, ensure_ascii=False)
+        plan_json = _json_dumps(plan)
         prompt = f"""
         Você é o AlphaBot, analista de vendas. Responda de forma direta, em português, com base SOMENTE nos dados fornecidos abaixo. 
         Formate valores monetários como R$ X.XXX,XX e inclua comparações, variações percentuais e insights executivos quando aplicável.
@@ -994,12 +1705,15 @@ def _narrate_results_with_llm(user_query: str, plan: Dict[str, Any], exec_res: D
 
         Gere uma resposta clara e objetiva, usando apenas o que está acima. Se algo não estiver nas colunas/linhas, diga que não está disponível.
         """
-        model = genai.GenerativeModel(model_name)
-        response = model.generate_content(prompt)
-        return response.text or summary or "Não há informações suficientes para responder."
+        produced = False
+        for piece in _stream_text(model_name, prompt):
+            produced = True
+            yield piece
+        if not produced:
+            yield summary or "Não há informações suficientes para responder."
     except Exception as e:
         # Fallback para pelo menos devolver o resumo
-        return f"(Não foi possível gerar a narrativa do LLM: {e})\n{exec_res.get('summary', '')}"
+        yield f"(Não foi possível gerar a narrativa do LLM: {e})\n{summary}"
 
 # --- Interface do Usuário com Streamlit ---
 st.set_page_config(
@@ -1012,6 +1726,9 @@ st.set_page_config(
 # Aplica todos os estilos CSS da aplicação
 ui_styles.apply_all_styles(st)
 
+# Estado do chat inicializado uma única vez por sessão
+st.session_state.setdefault("messages", [])
+
 # Logo personalizada do AlphaBot com linha decorativa
 import os
 import base64
@@ -1036,51 +1753,197 @@ else:
 
 sales_data_df, loaded_files, load_stats, drive_info = load_sales_data(GOOGLE_DRIVE_FOLDER_ID)
 
+# Modelos sugeridos (topo do seletor e fallback quando a listagem falha)
+_PREFERRED_MODELS: Tuple[str, ...] = (
+    'models/gemini-2.5-pro',
+    'models/gemini-2.5-flash',
+    'models/gemini-pro-latest',
+    'models/gemini-flash-latest',
+)
+
 # Descoberta automática de modelos (com cache e fallback)
-@st.cache_data(ttl=10800)
+@st.cache_data(ttl=86400)
 def get_available_models() -> List[str]:
     try:
-        models = []
-        for m in genai.list_models():
-            if hasattr(m, 'supported_generation_methods') and 'generateContent' in m.supported_generation_methods:
-                models.append(m.name)
-        # ordenar para lista estável
-        models = sorted(set(models))
-        # sugeridos primeiro
-        preferred = [
-            'models/gemini-2.5-pro',
-            'models/gemini-2.5-flash',
-            'models/gemini-pro-latest',
-            'models/gemini-flash-latest',
-        ]
-        # garantimos que preferidos venham no topo
-        head = [m for m in preferred if m in models]
-        tail = [m for m in models if m not in preferred]
-        return head + tail
+        # Uma passada: só modelos com generateContent; os sugeridos vão para o topo na ordem declarada
+        available = {
+            m.name for m in _genai().list_models()
+            if 'generateContent' in (getattr(m, 'supported_generation_methods', None) or ())
+        }
+        head = [m for m in _PREFERRED_MODELS if m in available]
+        return head + sorted(available.difference(head))
     except Exception:
         # Fallback simples
-        return [
-            'models/gemini-2.5-pro',
-            'models/gemini-2.5-flash',
-            'models/gemini-pro-latest',
-            'models/gemini-flash-latest',
-        ]
+        return list(_PREFERRED_MODELS)
 
 # Funções auxiliares para filtros e formatação
-def _apply_filters(df: pd.DataFrame, selected_files: List[str], filter_info: Dict) -> pd.DataFrame:
-    if df is None or df.empty:
-        return df
-    out = df
-    if selected_files and 'source_file' in out.columns:
-        out = out[out['source_file'].isin(selected_files)]
+def _isin_str(s: pd.Series, values: List[str]) -> np.ndarray:
+    """isin contra opções em texto; só converte a coluna para str quando ela não for textual.
+    Em Categorical, compara o texto das categorias e mapeia o resultado pelos códigos (sem converter a coluna)."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        hits = np.asarray(s.cat.categories.astype(str).isin(values), dtype=bool)
+        codes = s.cat.codes.to_numpy()
+        return np.where(codes >= 0, hits[codes], False) if len(hits) else np.zeros(len(s), dtype=bool)
+    if pd.api.types.is_string_dtype(s):
+        return s.isin(values).to_numpy()
+    return s.astype(str).isin(values).to_numpy()
+
+def _filter_mask(df: pd.DataFrame, selected_files: List[str], filter_info: Dict) -> np.ndarray:
+    """Máscara booleana dos filtros da sidebar (arquivos, produtos, regiões).
+    Cada predicado vira um array bool contíguo e todos são combinados em uma única redução."""
+    masks: List[np.ndarray] = []
+    if selected_files and 'source_file' in df.columns:
+        masks.append(_isin_str(df['source_file'], selected_files))
     if filter_info:
         # produto
-        if 'produtos' in filter_info and 'produto' in out.columns and filter_info['produtos']:
-            out = out[out['produto'].astype(str).isin(filter_info['produtos'])]
+        if 'produtos' in filter_info and 'produto' in df.columns and filter_info['produtos']:
+            masks.append(_isin_str(df['produto'], filter_info['produtos']))
         # regiao
-        if 'regioes' in filter_info and 'regiao' in out.columns and filter_info['regioes']:
-            out = out[out['regiao'].astype(str).isin(filter_info['regioes'])]
-    return out
+        if 'regioes' in filter_info and 'regiao' in df.columns and filter_info['regioes']:
+            masks.append(_isin_str(df['regiao'], filter_info['regioes']))
+    if not masks:
+        return np.ones(len(df), dtype=bool)
+    return np.logical_and.reduce(masks)
+
+def _apply_filters(df: pd.DataFrame, selected_files: List[str], filter_info: Dict) -> pd.DataFrame:
+    if df is None or df.empty:
+        return df
+    return df[_filter_mask(df, selected_files, filter_info)]
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _filtered_positions(data_key: Tuple, _df: pd.DataFrame, _selected_files: List[str], _filter_info: Dict) -> np.ndarray:
+    """Posições das linhas que passam nos filtros, com cache pela assinatura do recorte.
+    Guardamos só os índices (array pequeno) em vez de um DataFrame filtrado inteiro."""
+    return np.flatnonzero(_filter_mask(_df, _selected_files, _filter_info))
+
+def _cached_apply_filters(df: pd.DataFrame, data_key: Tuple, selected_files: List[str], filter_info: Dict) -> pd.DataFrame:
+    """Equivalente a _apply_filters, mas só recalcula as máscaras quando arquivos/filtros mudam."""
+    if df is None or df.empty:
+        return df
+    positions = _filtered_positions(data_key, df, selected_files, filter_info)
+    if len(positions) == len(df):
+        return df
+    return df.take(positions)
+
+def _data_signature(load_stats: Dict, selected_files: List[str], filter_info: Dict) -> Tuple:
+    """Assinatura do recorte atual sem varrer linhas: carga de origem + arquivos + filtros da sidebar."""
+    # valores ordenados: a mesma seleção em outra ordem de clique reaproveita o cache
+    filters = tuple(sorted((k, tuple(sorted(map(str, v)))) for k, v in (filter_info or {}).items()))
+    return (load_stats.get('loaded_at'), tuple(sorted(selected_files or [])), filters)
+
+def _filter_options(s: pd.Series, limit: int = 5000) -> Tuple[List[str], int]:
+    """Retorna (opções ordenadas até `limit`, total de valores distintos) para os filtros da sidebar.
+    Em colunas Categorical usa as categorias já deduplicadas, sem varrer a coluna inteira."""
+    if isinstance(s.dtype, pd.CategoricalDtype):
+        options = [str(c) for c in s.cat.categories]
+    else:
+        options = [str(v) for v in s.dropna().unique()]
+    options.sort()
+    return options[:limit], len(options)
+
+@st.cache_data(show_spinner=False)
+def _cached_filter_options(loaded_at: Any, column: str, _s: pd.Series) -> Tuple[List[str], int]:
+    """_filter_options calculado uma vez por carga (loaded_at) e coluna; os reruns da sidebar só leem a lista."""
+    return _filter_options(_s)
+
+def _csv_arrow_table(df: pd.DataFrame) -> 'Optional[pa.Table]':
+    """Tabela Arrow cujo CSV sai igual ao df.to_csv(index=False), ou None se algum tipo não tiver equivalente.
+    - datas só com meia-noite → date32 (2024-02-01); demais sem fração de segundo → timestamp[s]
+    - floats → texto via repr, como o pandas (2001.0, 1e-05); booleanos → True/False"""
+    if len(df.columns) < 2:
+        # Com uma coluna, o pandas escreve "" nas linhas nulas; deixamos com ele
+        return None
+    out: Dict[str, Any] = {}
+    types: Dict[str, Any] = {}
+    for c in df.columns:
+        col = df[c]
+        name = str(c)
+        if pd.api.types.is_datetime64_any_dtype(col):
+            if not pd.api.types.is_datetime64_dtype(col):
+                return None  # com fuso horário
+            valid = col.dropna()
+            if bool((valid == valid.dt.normalize()).all()):
+                types[name] = pa.date32()
+            elif bool((valid == valid.dt.floor('s')).all()):
+                types[name] = pa.timestamp('s')
+            else:
+                return None
+            out[name] = col
+        elif pd.api.types.is_bool_dtype(col):
+            out[name] = col.astype(object).map({True: 'True', False: 'False'})
+        elif pd.api.types.is_float_dtype(col):
+            out[name] = col.astype(object).map(repr).where(col.notna(), None)
+        else:
+            out[name] = col
+    table = pa.Table.from_pandas(pd.DataFrame(out, index=df.index), preserve_index=False)
+    for name, typ in types.items():
+        idx = table.schema.get_field_index(name)
+        table = table.set_column(idx, name, table.column(idx).cast(pa.timestamp('us')).cast(typ))
+    return table
+
+def _df_to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """Serializa o DataFrame em CSV (UTF-8), no mesmo formato do to_csv do pandas (datas, floats, aspas só
+    quando necessário). Usa o writer do pyarrow quando disponível; se algum valor exigir aspas, ou o tipo não
+    tiver equivalente (ex.: colunas object com tipos mistos), cai no to_csv do pandas."""
+    if _HAS_PYARROW:
+        try:
+            table = _csv_arrow_table(df)
+            if table is not None:
+                buf = io.StringIO()
+                csv.writer(buf, lineterminator='\n').writerow([str(c) for c in df.columns])
+                body = io.BytesIO()
+                # quoting_style='none' falha (ArrowInvalid) se algum valor tiver separador, aspas ou quebra de linha
+                pacsv.write_csv(table, body, write_options=pacsv.WriteOptions(include_header=False, quoting_style='none'))
+                return buf.getvalue().encode('utf-8') + body.getvalue()
+        except Exception:
+            pass
+    return df.to_csv(index=False).encode('utf-8')
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def _cached_memory_mb(data_key: Tuple, _df: pd.DataFrame) -> float:
+    """Memória do recorte em MB; memory_usage(deep=True) varre as strings, então roda uma vez por assinatura."""
+    return float(_df.memory_usage(deep=True).sum()) / 1024 / 1024
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def _cached_csv_bytes(data_key: Tuple, _df: pd.DataFrame) -> bytes:
+    """CSV do recorte com cache pela assinatura: reruns da sidebar sem mudança de filtros não reserializam."""
+    return _df_to_csv_bytes(_df)
+
+# Data usada na consulta de teste do painel de debug (comparada direto no buffer datetime64)
+_DEBUG_PROBE_DATE = np.datetime64('2025-01-01')
+
+# Colunas necessárias para derivar a receita quando 'receita_total' não existe
+_REV_COLS = frozenset(('quantidade', 'preco_unitario'))
+
+def _revenue_from_parts(df: pd.DataFrame) -> float:
+    """Soma de quantidade × preço unitário sem materializar coluna: um np.dot sobre os arrays.
+    Se houver NaN, refaz com nansum (mesma semântica do .sum() do pandas, que ignora NaN)."""
+    q = _as_numeric(df['quantidade']).to_numpy(dtype=np.float64, na_value=np.nan)
+    p = _as_numeric(df['preco_unitario']).to_numpy(dtype=np.float64, na_value=np.nan)
+    total = float(np.dot(q, p))
+    if np.isnan(total):
+        total = float(np.nansum(q * p))
+    return total
+
+@st.cache_data(show_spinner=False, max_entries=8, ttl=3600)
+def _compute_kpis(data_key: Tuple, _df: pd.DataFrame) -> Tuple[float, int, float]:
+    """Retorna (receita_total, transações, ticket_médio) do recorte, com cache pela assinatura dos dados."""
+    if 'receita_total' in _df.columns:
+        total_receita = float(_df['receita_total'].sum())
+    elif _REV_COLS.issubset(_df.columns):
+        total_receita = _revenue_from_parts(_df)
+    else:
+        total_receita = 0.0
+    total_transacoes = int(len(_df))
+    ticket_medio = (total_receita / total_transacoes) if total_transacoes > 0 else 0.0
+    return total_receita, total_transacoes, ticket_medio
+
+def _fmt_int(v: float) -> str:
+    """Formata inteiros com separador de milhar brasileiro (ex.: 1.234.567)."""
+    try:
+        return f"{int(v):,}".replace(',', '.')
+    except Exception:
+        return "0"
 
 def _fmt_brl(v: float) -> str:
     try:
@@ -1088,6 +1951,91 @@ def _fmt_brl(v: float) -> str:
     except Exception:
         return "R$ 0,00"
 
+# Templates HTML do card "Resumo da Carga" (montados uma vez, no import)
+_LOAD_SUMMARY_TMPL = string.Template("""
+    <div class="sidebar-card card-stats animate-fade-in">
+        <div class="sidebar-title title-stats">
+            📈 Resumo da Carga
+        </div>
+    </div>
+    <div style="display: flex; flex-direction: column; gap: 8px;">
+        <div style="display: flex; align-items: center; justify-content: space-between;">
+            <span style="color: #D1D5DB;">📁 Arquivos</span>
+            <div class="status-badge status-badge-info">$file_count</div>
+        </div>
+        <div style="display: flex; align-items: center; justify-content: space-between;">
+            <span style="color: #D1D5DB;">📊 Linhas</span>
+            <div class="status-badge">$row_count_str</div>
+        </div>
+        <div style="display: flex; align-items: center; justify-content: space-between;">
+            <span style="color: #D1D5DB;">⚡ Tempo</span>
+            <div class="status-badge status-badge-warning">${load_time}s</div>
+        </div>
+    </div>""")
+_DEDUP_NOTICE_TMPL = string.Template("""
+    <div style="margin-top: 12px; padding: 8px; background: rgba(245, 158, 11, 0.1); border-radius: 6px; border-left: 3px solid #F59E0B;">
+        <small style="color: #F59E0B;">🧹 Duplicatas removidas: $dedup_removed</small>
+    </div>""")
+_TABS_SKIPPED_TMPL = string.Template("""
+    <div style="margin-top: 8px; padding: 8px; background: rgba(107, 114, 128, 0.1); border-radius: 6px; border-left: 3px solid #6B7280;">
+        <small style="color: #9CA3AF;">📋 Abas agregadas ignoradas: $tabs_skipped</small>
+    </div>""")
+
+@st.cache_data(show_spinner=False)
+def _load_summary_html(stats_key: Tuple) -> str:
+    """HTML do card "Resumo da Carga". Recebe load_stats como tupla ordenada de itens (chave de cache),
+    então só é remontado quando a carga muda."""
+    stats = dict(stats_key)
+    html_parts = [_LOAD_SUMMARY_TMPL.substitute(
+        file_count=stats.get('file_count', 0),
+        row_count_str=_fmt_int(stats.get('row_count', 0)),
+        load_time=f"{stats.get('load_seconds', 0):.1f}",
+    )]
+
+    # Métricas extras em formato compacto
+    dedup_removed = stats.get('dedup_removed', 0) if 'rows_before_dedup' in stats else 0
+    if dedup_removed > 0:
+        html_parts.append(_DEDUP_NOTICE_TMPL.substitute(dedup_removed=dedup_removed))
+
+    tabs_skipped = stats.get('aggregated_tabs_skipped', 0)
+    if tabs_skipped > 0:
+        html_parts.append(_TABS_SKIPPED_TMPL.substitute(tabs_skipped=tabs_skipped))
+
+    return "".join(html_parts)
+
+@functools.lru_cache(maxsize=256)
+def _fmt_brl_cached(v: float) -> str:
+    """_fmt_brl memoizado; chamar com o valor já arredondado aos centavos para a chave deduplicar."""
+    return _fmt_brl(v)
+
+_LIST_ITEM_RE = re.compile(r"\s*(?:[-*+]|\d+[.)])\s")
+
+def _message_blocks(content: str, min_len: int = 2000) -> List[str]:
+    """Divide mensagens longas em blocos por parágrafo, para o frontend reaproveitar os blocos já renderizados.
+    Mensagens curtas ou com blocos de código (```) ficam inteiras para não quebrar a formatação.
+    Só corta em fronteiras de nível superior: parágrafos indentados (continuação de item) e itens de lista
+    seguem no bloco anterior, senão um "    texto" isolado viraria código e listas soltas se partiriam."""
+    if len(content) < min_len or '```' in content:
+        return [content]
+    blocks: List[str] = []
+    for part in content.split('\n\n'):
+        if not part.strip():
+            continue
+        head = part.lstrip('\n')
+        if blocks and (head[:1].isspace() or _LIST_ITEM_RE.match(head)):
+            blocks[-1] += '\n\n' + part
+        else:
+            blocks.append(part)
+    return blocks
+
+@st.fragment
+def _render_chat_history() -> None:
+    """Reexibe o histórico do chat em um fragment (interações internas não disparam rerun da página)."""
+    for message in st.session_state.messages:
+        with st.chat_message(message["role"]):
+            for block in _message_blocks(message["content"]):
+                st.markdown(block)
+
 with st.sidebar:
     # ============ SEÇÃO 1: CONFIGURAÇÕES ============
     st.markdown("""
@@ -1110,6 +2058,7 @@ with st.sidebar:
     col1, col2 = st.columns([1, 1])
     with col1:
         if st.button("🔄 Recarregar", use_container_width=True, help="Limpa o cache e recarrega os arquivos do Drive"):
+            load_sales_data.clear()
             st.cache_data.clear()
             st.rerun()
     with col2:
@@ -1132,13 +2081,10 @@ with st.sidebar:
     if not sales_data_df.empty:
         df_for_filters = sales_data_df
         
-        # Contadores para badges
-        total_products = len(df_for_filters['produto'].dropna().unique()) if 'produto' in df_for_filters.columns else 0
-        total_regions = len(df_for_filters['regiao'].dropna().unique()) if 'regiao' in df_for_filters.columns else 0
-        
         # Produtos
         if 'produto' in df_for_filters.columns:
-            prods = sorted([p for p in df_for_filters['produto'].dropna().astype(str).unique()][:5000])
+            # Opções e contador do badge saem da mesma passada
+            prods, total_products = _cached_filter_options(load_stats.get('loaded_at'), 'produto', df_for_filters['produto'])
             
             st.markdown(f"""
             <div style="display: flex; align-items: center; gap: 8px; margin-bottom: 8px;">
@@ -1157,7 +2103,7 @@ with st.sidebar:
         
         # Regiões
         if 'regiao' in df_for_filters.columns:
-            regs = sorted([r for r in df_for_filters['regiao'].dropna().astype(str).unique()][:5000])
+            regs, total_regions = _cached_filter_options(load_stats.get('loaded_at'), 'regiao', df_for_filters['regiao'])
             
             st.markdown(f"""
             <div style="display: flex; align-items: center; gap: 8px; margin: 16px 0 8px 0;">
@@ -1223,7 +2169,7 @@ with st.sidebar:
             default_checked = st.session_state.get(key, True)
             
             # Formatação melhorada
-            rows_text = f"{f.get('rows', 0):,}".replace(',', '.')
+            rows_text = _fmt_int(f.get('rows', 0))
             file_size = f"({rows_text} linhas)"
             
             checked = st.checkbox(
@@ -1252,17 +2198,25 @@ with st.sidebar:
     """, unsafe_allow_html=True)
     
     if not sales_data_df.empty and selected_file_names:
-        preview_df = _apply_filters(sales_data_df, selected_file_names, filter_info)
+        preview_key = _data_signature(load_stats, selected_file_names, filter_info)
+        preview_df = _cached_apply_filters(
+            sales_data_df,
+            preview_key,
+            selected_file_names,
+            filter_info,
+        )
         
         if not preview_df.empty:
             # Status dos dados
+            # Números formatados campo a campo (separador de milhar '.', decimal ','), sem reescrever o HTML inteiro
+            memory_mb = _cached_memory_mb(preview_key, preview_df)
             st.markdown(f"""
             <div style="display: flex; flex-wrap: wrap; gap: 4px; margin: 12px 0;">
-                <div class="status-badge">{len(preview_df):,} registros</div>
+                <div class="status-badge">{_fmt_int(len(preview_df))} registros</div>
                 <div class="status-badge status-badge-info">{len(preview_df.columns)} colunas</div>
-                <div class="status-badge status-badge-warning">{preview_df.memory_usage(deep=True).sum() / 1024 / 1024:.1f} MB</div>
+                <div class="status-badge status-badge-warning">{f"{memory_mb:.1f}".replace('.', ',')} MB</div>
             </div>
-            """.replace(',', '.'), unsafe_allow_html=True)
+            """, unsafe_allow_html=True)
             
             # === PAINEL DE DIAGNÓSTICO (apenas se debug_mode ativo) ===
             if st.session_state.get("debug_mode", False):
@@ -1308,7 +2262,7 @@ with st.sidebar:
                 st.dataframe(preview_df.head(25), use_container_width=True)
             
             # Botão de download estilizado
-            csv_data = preview_df.to_csv(index=False)
+            csv_data = _cached_csv_bytes(preview_key, preview_df)
             st.download_button(
                 label="📥 Baixar CSV consolidado",
                 data=csv_data,
@@ -1351,201 +2305,160 @@ with st.sidebar:
     
     if debug_mode:
         st.info("ℹ️ Modo debug ativo. Painéis de diagnóstico serão exibidos.")
+        # A consulta de teste varre o recorte inteiro; só roda a cada pergunta se for pedida
+        st.checkbox(
+            "Rodar consulta de teste (Monitor 4k + Norte + 2025-01-01)",
+            value=False,
+            key="debug_probe",
+            help="Executa a consulta de diagnóstico fixa no painel de debug de cada pergunta."
+        )
     else:
         st.caption("💡 Ative para ver informações técnicas e logs detalhados")
 
     # ============ SEÇÃO 6: RESUMO DA CARGA ============
-    st.markdown("""
-    <div class="sidebar-card card-stats animate-fade-in">
-        <div class="sidebar-title title-stats">
-            📈 Resumo da Carga
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    # Métricas em badges
-    file_count = load_stats.get('file_count', 0)
-    row_count = load_stats.get('row_count', 0)
-    load_time = load_stats.get('load_seconds', 0)
-    
-    st.markdown(f"""
-    <div style="display: flex; flex-direction: column; gap: 8px;">
-        <div style="display: flex; align-items: center; justify-content: space-between;">
-            <span style="color: #D1D5DB;">📁 Arquivos</span>
-            <div class="status-badge status-badge-info">{file_count}</div>
-        </div>
-        <div style="display: flex; align-items: center; justify-content: space-between;">
-            <span style="color: #D1D5DB;">📊 Linhas</span>
-            <div class="status-badge">{row_count:,}".replace(',', '.')</div>
-        </div>
-        <div style="display: flex; align-items: center; justify-content: space-between;">
-            <span style="color: #D1D5DB;">⚡ Tempo</span>
-            <div class="status-badge status-badge-warning">{load_time:.1f}s</div>
-        </div>
-    </div>
-    """, unsafe_allow_html=True)
-    
-    # Métricas extras em formato compacto
-    if 'rows_before_dedup' in load_stats and 'dedup_removed' in load_stats:
-        dedup_removed = load_stats.get('dedup_removed', 0)
-        if dedup_removed > 0:
-            st.markdown(f"""
-            <div style="margin-top: 12px; padding: 8px; background: rgba(245, 158, 11, 0.1); border-radius: 6px; border-left: 3px solid #F59E0B;">
-                <small style="color: #F59E0B;">🧹 Duplicatas removidas: {dedup_removed}</small>
-            </div>
-            """, unsafe_allow_html=True)
-    
-    if 'aggregated_tabs_skipped' in load_stats:
-        tabs_skipped = load_stats.get('aggregated_tabs_skipped', 0)
-        if tabs_skipped > 0:
-            st.markdown(f"""
-            <div style="margin-top: 8px; padding: 8px; background: rgba(107, 114, 128, 0.1); border-radius: 6px; border-left: 3px solid #6B7280;">
-                <small style="color: #9CA3AF;">📋 Abas agregadas ignoradas: {tabs_skipped}</small>
-            </div>
-            """, unsafe_allow_html=True)
+    # Todo o bloco vai em um único st.markdown, com o HTML cacheado pela assinatura de load_stats
+    st.markdown(_load_summary_html(tuple(sorted(load_stats.items()))), unsafe_allow_html=True)
 
 if not sales_data_df.empty:
     st.success(f"Dados de {len(sales_data_df)} transações carregados com sucesso!")
     # Aplica filtros da sidebar
-    filtered_df = _apply_filters(sales_data_df, selected_file_names if 'selected_file_names' in locals() else [], filter_info if 'filter_info' in locals() else {})
-
-    # KPIs
-    receita_col = 'receita_total' if 'receita_total' in filtered_df.columns else None
-    if not receita_col and {'quantidade','preco_unitario'}.issubset(filtered_df.columns):
-        receita_col = 'receita_total_temp'
-        filtered_df[receita_col] = filtered_df['quantidade'] * filtered_df['preco_unitario']
-    total_receita = float(filtered_df[receita_col].sum()) if receita_col else 0.0
-    total_transacoes = int(len(filtered_df))
-    ticket_medio = (total_receita / total_transacoes) if total_transacoes > 0 else 0.0
+    # Chave de cache do recorte filtrado, calculada uma vez por rerun
+    data_key = _data_signature(load_stats, selected_file_names if 'selected_file_names' in locals() else [], filter_info if 'filter_info' in locals() else {})
+    filtered_df = _cached_apply_filters(sales_data_df, data_key, selected_file_names if 'selected_file_names' in locals() else [], filter_info if 'filter_info' in locals() else {})
+
+    # KPIs (cacheados por recorte; reruns que só mexem no chat não recalculam)
+    total_receita, total_transacoes, ticket_medio = _compute_kpis(data_key, filtered_df)
 
     # Métricas próximas e alinhadas à esquerda
     c1, c2, c3 = st.columns([3, 3, 6])
-    c1.metric("Receita total (estimada)", _fmt_brl(total_receita))
-    c2.metric("Ticket médio (por venda)", _fmt_brl(ticket_medio))
+    c1.metric("Receita total (estimada)", _fmt_brl_cached(round(total_receita, 2)))
+    c2.metric("Ticket médio (por venda)", _fmt_brl_cached(round(ticket_medio, 2)))
     
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
-
-    for message in st.session_state.messages:
-        with st.chat_message(message["role"]):
-            st.markdown(message["content"])
+    _render_chat_history()
 
     if user_query := st.chat_input("Qual a sua pergunta sobre as vendas?"):
+        # Modelo escolhido na sidebar (o widget já gravou a chave); lido uma vez por pergunta
+        model_name = st.session_state.get("model_name", 'models/gemini-2.5-flash')
         st.session_state.messages.append({"role": "user", "content": user_query})
         with st.chat_message("user"):
             st.markdown(user_query)
 
         with st.chat_message("assistant"):
-            # === DETECÇÃO DE PERGUNTAS MULTI-STEP ===
-            is_multistep = _detect_multistep_query(user_query)
+            # Perguntas diretas de KPI são respondidas localmente, sem chamadas ao LLM
+            final_text = _try_fast_answer(user_query, filtered_df, kpis=(total_receita, total_transacoes, ticket_medio))
+            if final_text is not None:
+                st.markdown(final_text)
+            else:
+                # === DETECÇÃO DE PERGUNTAS MULTI-STEP ===
+                is_multistep = _detect_multistep_query(user_query)
             
-            if is_multistep:
-                st.warning("""
-                ⚠️ **Pergunta Complexa Detectada**
+                if is_multistep:
+                    st.warning("""
+                    ⚠️ **Pergunta Complexa Detectada**
                 
-                Sua pergunta parece ter múltiplas etapas dependentes (exemplo: "qual dia teve maior receita **e qual produto** foi mais vendido **nesse dia**").
+                    Sua pergunta parece ter múltiplas etapas dependentes (exemplo: "qual dia teve maior receita **e qual produto** foi mais vendido **nesse dia**").
                 
-                Por limitações das ferramentas gratuitas utilizadas neste projeto, perguntas com dependências sequenciais podem gerar **respostas inconsistentes**.
+                    Por limitações das ferramentas gratuitas utilizadas neste projeto, perguntas com dependências sequenciais podem gerar **respostas inconsistentes**.
                 
-                **💡 Solução Recomendada:** Divida sua pergunta em etapas:
+                    **💡 Solução Recomendada:** Divida sua pergunta em etapas:
                 
-                1️⃣ Primeiro: "Qual foi o dia em 2024 com maior Receita Total?"
+                    1️⃣ Primeiro: "Qual foi o dia em 2024 com maior Receita Total?"
                 
-                2️⃣ Depois: "Qual foi o produto mais vendido em [data obtida]?"
+                    2️⃣ Depois: "Qual foi o produto mais vendido em [data obtida]?"
                 
-                Vou tentar responder mesmo assim, mas recomendo usar perguntas separadas para garantir precisão.
-                """)
+                    Vou tentar responder mesmo assim, mas recomendo usar perguntas separadas para garantir precisão.
+                    """)
                 
-            with st.spinner("Analisando os dados..."):
-                # === DEBUG: Painel expansível com informações da consulta (apenas se debug_mode ativo) ===
-                debug_mode_active = st.session_state.get("debug_mode", False)
+                with st.spinner("Analisando os dados..."):
+                    # === DEBUG: Painel expansível com informações da consulta (apenas se debug_mode ativo) ===
+                    debug_mode_active = st.session_state.get("debug_mode", False)
                 
-                if debug_mode_active:
-                    debug_expander = st.expander("🔍 Debug da Consulta", expanded=False)
+                    if debug_mode_active:
+                        debug_expander = st.expander("🔍 Debug da Consulta", expanded=False)
                 
-                # 1) Tenta Planner→Executor
-                catalog = _build_data_catalog(filtered_df)
+                    # 1) Tenta Planner→Executor
+                    catalog = _cached_data_catalog(data_key, filtered_df)
                 
-                if debug_mode_active:
-                    with debug_expander:
-                        st.markdown("**📊 Dados disponíveis para a consulta:**")
-                        st.text(f"Total de registros: {len(filtered_df)}")
-                        st.text(f"Colunas: {list(filtered_df.columns)}")
+                    if debug_mode_active:
+                        with debug_expander:
+                            st.markdown("**📊 Dados disponíveis para a consulta:**")
+                            st.text(f"Total de registros: {len(filtered_df)}")
+                            st.text(f"Colunas: {', '.join(map(str, filtered_df.columns))}")
                         
-                        # Teste específico da consulta
-                        if 'produto' in filtered_df.columns and 'regiao' in filtered_df.columns and 'data' in filtered_df.columns:
-                            st.markdown("**🎯 Teste específico: Monitor 4k + Norte + 2025-01-01**")
-                            test_data = filtered_df[
-                                (filtered_df['produto'].astype(str).str.contains('Monitor 4k', case=False, na=False)) &
-                                (filtered_df['regiao'].astype(str).str.contains('Norte', case=False, na=False)) &
-                                (filtered_df['data'] == pd.to_datetime('2025-01-01'))
-                            ]
-                            st.text(f"Registros encontrados: {len(test_data)}")
-                            if len(test_data) > 0:
-                                st.dataframe(test_data[['data', 'produto', 'regiao', 'quantidade', 'preco_unitario', 'receita_total']].head())
-                                st.text(f"Receita total: R$ {test_data['receita_total'].sum():,.2f}")
-                            else:
-                                st.warning("⚠️ Nenhum registro encontrado com esses critérios!")
-                                st.text("Verificando critérios individualmente:")
-                                monitor = filtered_df[filtered_df['produto'].astype(str).str.contains('Monitor 4k', case=False, na=False)]
-                                st.text(f"  'Monitor 4k': {len(monitor)} registros")
-                                if len(monitor) > 0:
-                                    st.text(f"    Exemplos: {monitor['produto'].head(3).tolist()}")
-                                norte = filtered_df[filtered_df['regiao'].astype(str).str.contains('Norte', case=False, na=False)]
-                                st.text(f"  'Norte': {len(norte)} registros")
-                                if len(norte) > 0:
-                                    st.text(f"    Exemplos: {norte['regiao'].head(3).tolist()}")
-                                jan1 = filtered_df[filtered_df['data'] == pd.to_datetime('2025-01-01')]
-                                st.text(f"  '2025-01-01': {len(jan1)} registros")
+                            # Teste específico da consulta
+                            if st.session_state.get("debug_probe", False) and {'produto', 'regiao', 'data'}.issubset(filtered_df.columns):
+                                st.markdown("**🎯 Teste específico: Monitor 4k + Norte + 2025-01-01**")
+                                # Cada critério vira uma máscara bool calculada uma única vez (busca literal, sem regex)
+                                m_monitor = _contains_ci_mask(filtered_df['produto'], 'Monitor 4k')
+                                m_norte = _contains_ci_mask(filtered_df['regiao'], 'Norte')
+                                data_col = filtered_df['data']
+                                if pd.api.types.is_datetime64_dtype(data_col):
+                                    m_jan1 = data_col.to_numpy() == _DEBUG_PROBE_DATE
+                                else:
+                                    m_jan1 = (data_col == pd.Timestamp(_DEBUG_PROBE_DATE)).to_numpy(dtype=bool, na_value=False)
+                                test_data = filtered_df.loc[m_monitor & m_norte & m_jan1]
+                                st.text(f"Registros encontrados: {len(test_data)}")
+                                if len(test_data) > 0:
+                                    st.dataframe(test_data[['data', 'produto', 'regiao', *_KPI_NUMERIC_COLS]].head())
+                                    st.text(f"Receita total: R$ {test_data['receita_total'].sum():,.2f}")
+                                else:
+                                    st.warning("⚠️ Nenhum registro encontrado com esses critérios!")
+                                    st.text("Verificando critérios individualmente:")
+                                    monitor = filtered_df.loc[m_monitor]
+                                    st.text(f"  'Monitor 4k': {len(monitor)} registros")
+                                    if len(monitor) > 0:
+                                        st.text(f"    Exemplos: {monitor['produto'].head(3).tolist()}")
+                                    norte = filtered_df.loc[m_norte]
+                                    st.text(f"  'Norte': {len(norte)} registros")
+                                    if len(norte) > 0:
+                                        st.text(f"    Exemplos: {norte['regiao'].head(3).tolist()}")
+                                    jan1_count = int(m_jan1.sum())
+                                    st.text(f"  '2025-01-01': {jan1_count} registros")
                         
-                        st.markdown("**📋 Catálogo enviado ao LLM:**")
-                        st.json(catalog, expanded=False)
+                            st.markdown("**📋 Catálogo enviado ao LLM:**")
+                            st.json(catalog, expanded=False)
                 
-                plan = _plan_with_llm(user_query, catalog, model_name=st.session_state.get("model_name", 'models/gemini-2.5-flash'))
+                    plan = _plan_with_llm(user_query, catalog, model_name=model_name, catalog_json=_cached_catalog_json(data_key, catalog))
                 
-                if debug_mode_active:
-                    with debug_expander:
-                        st.markdown("**🤖 Plano gerado pelo LLM:**")
-                        st.json(plan, expanded=False)
+                    if debug_mode_active:
+                        with debug_expander:
+                            st.markdown("**🤖 Plano gerado pelo LLM:**")
+                            st.json(plan, expanded=False)
                 
-                used_planner = False
-                final_text = ""
-                if isinstance(plan, dict) and not plan.get('error'):
-                    used_planner = True
-                    exec_res = _execute_plan(filtered_df, plan)
-                    # Não exibimos a tabela; apenas geramos a narrativa baseada no resultado interno
-                    final_text = _narrate_results_with_llm(
-                        user_query=user_query,
-                        plan=plan,
-                        exec_res=exec_res,
-                        model_name=st.session_state.get("model_name", 'models/gemini-2.5-flash')
-                    )
-                # 2) Fallback: resumo + amostra para o LLM
-                if not used_planner:
-                    # Se planner falhou, notificar usuário quando debug ativado
-                    if st.session_state.get("debug_mode", False):
-                        st.warning("⚠️ Consulta complexa detectada - usando análise alternativa com dados completos")
+                    used_planner = False
+                    answer_stream: Iterator[str] = iter(())
+                    if isinstance(plan, dict) and not plan.get('error'):
+                        used_planner = True
+                        # filtered_df vem de take() com posições crescentes, então mantém a ordem da carga
+                        exec_res = _cached_execute_plan(plan, data_key, filtered_df, sorted_by_date=bool(load_stats.get('sorted_by_data')))
+                        # Não exibimos a tabela; apenas geramos a narrativa baseada no resultado interno
+                        answer_stream = _answer_from_plan(
+                            user_query=user_query,
+                            plan=plan,
+                            exec_res=exec_res,
+                            model_name=model_name
+                        )
+                    # 2) Fallback: resumo + amostra para o LLM
+                    if not used_planner:
+                        # Se planner falhou, notificar usuário quando debug ativado
+                        if st.session_state.get("debug_mode", False):
+                            st.warning("⚠️ Consulta complexa detectada - usando análise alternativa com dados completos")
                     
-                    # Para datasets pequenos (< 5000 linhas), usar dados completos
-                    total_rows = len(filtered_df)
-                    rows_to_use = total_rows if total_rows < 5000 else 3000
+                        # Amostra limitada a _FALLBACK_SAMPLE_ROWS linhas (recortes menores vão inteiros)
+                        total_rows = len(filtered_df)
+                        rows_to_use = min(total_rows, _FALLBACK_SAMPLE_ROWS)
                     
-                    resumo, csv_amostra = _prepare_analysis_payload(filtered_df, max_rows=rows_to_use)
-                    compact_query = f"""
-                    CONTEXTO: Abaixo há um resumo estatístico dos dados de vendas e uma amostra de linhas.
-                    Use APENAS essas informações para responder. Caso precise de algo fora disso, diga que não está disponível.
-
-                    RESUMO DOS DADOS
-                    {resumo}
-
-                    AMOSTRA (CSV - {'todas as ' + str(rows_to_use) if total_rows < 5000 else 'até ' + str(rows_to_use)} linhas)
-                    {csv_amostra}
-
-                    PERGUNTA DO USUÁRIO
-                    {user_query}
-                    """
-                    final_text = get_gemini_analysis(compact_query, filtered_df, model_name=st.session_state.get("model_name", 'models/gemini-2.5-flash'))
-                st.markdown(final_text)
+                        resumo, amostra = _cached_analysis_payload(data_key, filtered_df, max_rows=rows_to_use)
+                        data_context = f"""
+                        RESUMO DOS DADOS
+                        {resumo}
+
+                        AMOSTRA (JSON por coluna - {'todas as ' + str(total_rows) if rows_to_use == total_rows else str(rows_to_use) + ' de ' + str(total_rows)} linhas)
+                        {amostra}
+                        """
+                        answer_stream = get_gemini_analysis(user_query, filtered_df, model_name=model_name, data_context=data_context)
+                    # Renderiza os trechos conforme chegam e devolve o texto completo para o histórico
+                    final_text = st.write_stream(answer_stream)
             st.session_state.messages.append({"role": "assistant", "content": final_text})
 else:
     st.error("Não foi possível carregar os dados de vendas. Verifique as configurações e a estrutura das planilhas.")       
\ No newline at end of file
@@ -0,0 +1,46 @@
+"""Carrega as definições de nível de módulo de main.py (imports, constantes e funções) para os testes.
+
+main.py monta a interface do Streamlit no import, então o módulo não é importado diretamente:
+as definições são extraídas da AST do arquivo.
+"""
+import ast
+import os
+import sys
+import types
+from typing import Iterable
+
+_MAIN_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'main.py')
+
+
+def load_main_definitions(block_modules: Iterable[str] = ()) -> types.SimpleNamespace:
+    """Executa as definições de main.py. Os módulos em block_modules ficam indisponíveis durante o
+    import (sys.modules[nome] = None), para exercitar os fallbacks de dependências opcionais."""
+    with open(_MAIN_PATH, encoding='utf-8') as fh:
+        tree = ast.parse(fh.read())
+    body = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            if any(alias.name in ('config', 'ui_styles') for alias in node.names):
+                continue
+            body.append(node)
+        elif isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            body.append(node)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            if all(isinstance(t, ast.Name) and t.id.startswith('_') for t in targets):
+                body.append(node)
+        elif isinstance(node, ast.Try) and 'config' not in ast.unparse(node):
+            body.append(node)
+    namespace = {'__name__': 'main_definitions'}
+    saved = {name: sys.modules.get(name) for name in block_modules}
+    try:
+        for name in block_modules:
+            sys.modules[name] = None
+        exec(compile(ast.Module(body=body, type_ignores=[]), _MAIN_PATH, 'exec'), namespace)
+    finally:
+        for name, module in saved.items():
+            if module is None:
+                sys.modules.pop(name, None)
+            else:
+                sys.modules[name] = module
+    return types.SimpleNamespace(**namespace)
@@ -0,0 +1,50 @@
+"""Download em CSV: o writer do pyarrow gera o mesmo arquivo que o to_csv do pandas."""
+import unittest
+
+from main_defs import load_main_definitions
+
+M = load_main_definitions()
+pd = M.pd
+
+
+def _sample_frame() -> 'pd.DataFrame':
+    return pd.DataFrame({
+        'data': pd.to_datetime(['2024-02-01', None, '2024-02-03']),
+        'produto': pd.Categorical(['Mouse', None, 'Teclado']),
+        'quantidade': [2, 1, 3],
+        'preco_unitario': [2001.0, float('nan'), 1e-05],
+        'ativo': [True, False, True],
+    })
+
+
+class CsvExportTest(unittest.TestCase):
+    def assertSameAsPandas(self, df):
+        self.assertEqual(M._df_to_csv_bytes(df), df.to_csv(index=False).encode('utf-8'))
+
+    def test_matches_pandas_format(self):
+        df = _sample_frame()
+        self.assertSameAsPandas(df)
+        first_row = M._df_to_csv_bytes(df).decode('utf-8').splitlines()[1]
+        self.assertEqual(first_row, '2024-02-01,Mouse,2,2001.0,True')
+
+    def test_matches_pandas_with_arrow_columns(self):
+        self.assertSameAsPandas(M._to_arrow_numeric(_sample_frame()))
+
+    def test_times_and_values_needing_quotes(self):
+        df = _sample_frame()
+        df['data'] = df['data'] + pd.Timedelta(hours=10)
+        df['produto'] = df['produto'].astype(object)
+        df.loc[0, 'produto'] = 'Mouse, sem fio'
+        self.assertSameAsPandas(df)
+
+
+class CsvExportWithoutPyarrowTest(unittest.TestCase):
+    def test_module_loads_and_falls_back_to_pandas(self):
+        M_sem = load_main_definitions(block_modules=('pyarrow', 'pyarrow.csv'))
+        self.assertFalse(M_sem._HAS_PYARROW)
+        df = _sample_frame()
+        self.assertEqual(M_sem._df_to_csv_bytes(df), df.to_csv(index=False).encode('utf-8'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+"""Leitura de CSV: colunas numéricas fora das KPIs continuam numéricas."""
+import unittest
+
+from main_defs import load_main_definitions
+
+M = load_main_definitions()
+
+CSV_BR = (
+    "Data;Produto;Região;Quantidade;Preço Unitário;Custo\n"
+    "01/02/2024;Mouse;Norte;2;10,50;7,5\n"
+    "02/02/2024;Teclado;Sul;1;1.200,00;4,25\n"
+).encode('utf-8')
+
+
+class CsvNumericColumnsTest(unittest.TestCase):
+    def _read(self, data: bytes):
+        delimiter, decimal, _ = M._sniff_csv_format(data)
+        return M._prepare_csv_frame(M._read_csv_as_text(data, delimiter, decimal), decimal)
+
+    def test_non_kpi_numeric_column_is_numeric(self):
+        df = self._read(CSV_BR)
+        self.assertTrue(M.pd.api.types.is_numeric_dtype(df['custo']))
+        self.assertEqual(df['custo'].tolist(), [7.5, 4.25])
+        self.assertEqual(df['preco_unitario'].tolist(), [10.5, 1200.0])
+
+    def test_non_kpi_numeric_column_is_a_metric(self):
+        df = self._read(CSV_BR)
+        self.assertIn('custo', M._build_data_catalog(df)['metrics'])
+        result = M._execute_plan(df, {'metrics': [{'name': 'custo', 'agg': 'sum'}]})
+        self.assertAlmostEqual(float(result['table']['custo'].iloc[0]), 11.75)
+
+    def test_text_columns_stay_text(self):
+        df = self._read(CSV_BR)
+        self.assertEqual(df['produto'].tolist(), ['Mouse', 'Teclado'])
+        self.assertFalse(M.pd.api.types.is_numeric_dtype(df['produto']))
+
+
+if __name__ == '__main__':
+    unittest.main()
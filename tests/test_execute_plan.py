@@ -0,0 +1,38 @@
+"""Recorte por período do executor: busca binária (coluna ordenada na carga) e máscara dão o mesmo resultado."""
+import unittest
+
+from main_defs import load_main_definitions
+
+M = load_main_definitions()
+pd = M.pd
+
+PLAN = {'filters': {'date_range': ['2024-01-02', '2024-01-03']}, 'metrics': [{'name': 'receita_total', 'agg': 'sum'}]}
+
+
+def _sorted_frame() -> 'pd.DataFrame':
+    return pd.DataFrame({
+        'data': pd.to_datetime(['2024-01-01', '2024-01-02', '2024-01-02', '2024-01-03', '2024-01-05', None]),
+        'receita_total': [1.0, 2.0, 4.0, 8.0, 16.0, 32.0],
+    })
+
+
+class SortedDateBoundsTest(unittest.TestCase):
+    def test_bounds_skip_trailing_nat(self):
+        df = _sorted_frame()
+        self.assertEqual(M._sorted_date_bounds(df['data'], pd.Timestamp('2024-01-02'), pd.Timestamp('2024-01-03')), (1, 4))
+        self.assertEqual(M._sorted_date_bounds(df['data'], pd.Timestamp('2024-01-04'), pd.Timestamp('2030-01-01')), (4, 5))
+
+    def test_sorted_and_mask_paths_agree(self):
+        df = _sorted_frame()
+        fast = M._execute_plan(df, PLAN, sorted_by_date=True)['table']
+        slow = M._execute_plan(df, PLAN)['table']
+        self.assertEqual(fast['receita_total'].tolist(), [14.0])
+        self.assertEqual(slow['receita_total'].tolist(), [14.0])
+
+    def test_unsorted_frame_uses_mask(self):
+        df = _sorted_frame().iloc[::-1].reset_index(drop=True)
+        self.assertEqual(M._execute_plan(df, PLAN)['table']['receita_total'].tolist(), [14.0])
+
+
+if __name__ == '__main__':
+    unittest.main()
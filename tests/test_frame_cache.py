@@ -0,0 +1,35 @@
+"""Cache em disco dos frames por arquivo: abas ignoradas e avisos voltam junto com o frame."""
+import tempfile
+import unittest
+
+from main_defs import load_main_definitions
+
+M = load_main_definitions()
+pd = M.pd
+
+
+@unittest.skipUnless(M._HAS_PYARROW, 'cache em disco exige pyarrow')
+class FrameCacheTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self._globals = M._frame_cache_path.__globals__
+        self._saved_dir = self._globals['_FRAME_CACHE_DIR']
+        self._globals['_FRAME_CACHE_DIR'] = self._tmp.name
+
+    def tearDown(self):
+        self._globals['_FRAME_CACHE_DIR'] = self._saved_dir
+        self._tmp.cleanup()
+
+    def test_warnings_round_trip(self):
+        item = {'id': 'abc', 'modifiedTime': '2024-01-01T00:00:00Z'}
+        df = pd.DataFrame({'produto': ['Mouse'], 'receita_total': [0.0]})
+        warnings = ["⚠️ Todas as receitas em 'vendas.xlsx' são zero - verifique formatação"]
+        M._write_cached_frame(item, df, 2, warnings)
+        cached = M._read_cached_frame(item)
+        self.assertEqual(cached.attrs['tabs_skipped'], 2)
+        self.assertEqual(cached.attrs['warnings'], warnings)
+        self.assertEqual(df.attrs, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
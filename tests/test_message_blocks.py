@@ -0,0 +1,26 @@
+"""Divisão do histórico do chat em blocos: só em fronteiras de nível superior do markdown."""
+import unittest
+
+from main_defs import load_main_definitions
+
+M = load_main_definitions()
+
+
+class MessageBlocksTest(unittest.TestCase):
+    def test_short_message_stays_whole(self):
+        self.assertEqual(M._message_blocks('a\n\nb'), ['a\n\nb'])
+
+    def test_splits_top_level_paragraphs(self):
+        text = 'Resumo das vendas.\n\nSegundo parágrafo.'
+        self.assertEqual(M._message_blocks(text, min_len=0), ['Resumo das vendas.', 'Segundo parágrafo.'])
+
+    def test_list_and_continuation_stay_together(self):
+        lista = '1. Mouse: R$ 10\n\n    detalhe do item\n\n2. Teclado: R$ 20'
+        text = 'Principais produtos:\n\n' + lista + '\n\nConclusão.'
+        blocks = M._message_blocks(text, min_len=0)
+        self.assertEqual(blocks, ['Principais produtos:\n\n' + lista, 'Conclusão.'])
+        self.assertEqual('\n\n'.join(blocks), text)
+
+
+if __name__ == '__main__':
+    unittest.main()
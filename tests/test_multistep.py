@@ -0,0 +1,20 @@
+"""Detecção de perguntas em múltiplas etapas: o padrão combinado não diferencia maiúsculas."""
+import unittest
+
+from main_defs import load_main_definitions
+
+M = load_main_definitions()
+
+
+class MultistepPatternTest(unittest.TestCase):
+    def test_pattern_ignores_case(self):
+        self.assertIsNotNone(M._MULTISTEP_PAT.search('Qual foi o MAIOR dia E QUAL produto vendeu mais NESSE DIA?'))
+        self.assertIsNotNone(M._MULTISTEP_PAT.search('Nessa Região, quanto vendemos?'))
+
+    def test_detect_multistep_query(self):
+        self.assertTrue(M._detect_multistep_query('Qual o mês de MAIOR venda E QUAL o produto líder?'))
+        self.assertFalse(M._detect_multistep_query('Qual a receita total?'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+"""Valores nativos do Sheets (UNFORMATTED_VALUE): só colunas com texto misturado viram texto."""
+import unittest
+
+from main_defs import load_main_definitions
+
+M = load_main_definitions()
+pd = M.pd
+
+
+class StringifyMixedColumnsTest(unittest.TestCase):
+    def test_numbers_and_none_stay_numeric(self):
+        df = pd.DataFrame({'custo': pd.Series([7, 4.25, None], dtype=object)})
+        out = M._stringify_mixed_columns(df)
+        self.assertEqual(out['custo'].tolist()[:2], [7, 4.25])
+        self.assertEqual(pd.to_numeric(out['custo']).sum(), 11.25)
+
+    def test_numbers_mixed_with_text_become_text(self):
+        df = pd.DataFrame({'codigo': pd.Series([101, 'A-7', None], dtype=object)})
+        out = M._stringify_mixed_columns(df)
+        self.assertEqual(out['codigo'].tolist()[:2], ['101', 'A-7'])
+        self.assertTrue(pd.isna(out['codigo'].iloc[2]))
+
+
+if __name__ == '__main__':
+    unittest.main()